@@ -0,0 +1,99 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/nedbat/unittest-mixins/blob/master/NOTICE.txt
+
+"""Measure how long it takes to import unittest_mixins.
+
+Run it like this::
+
+    python benchmarks/bench_import.py [--runs N] [--max-us N]
+
+Each run starts a new interpreter with "-X importtime" (Python 3.7+), and the
+fastest run is reported: the time to import the package, and the time to
+then use one of its names, which imports unittest_mixins.mixins.  The
+modules costing the most are listed too.
+
+With --max-us, the exit status is 1 if using the package took longer than
+that many microseconds, so this can be used to guard against regressions.
+
+"""
+
+from __future__ import print_function
+
+import re
+import subprocess
+import sys
+
+PROGRAM = "import unittest_mixins; unittest_mixins.TempDirMixin"
+
+# The lines written by -X importtime:
+#   import time:       self [us] |   cumulative | imported package
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_times():
+    """Run PROGRAM once, and return a list of (module, self_us, cumulative_us, depth)."""
+    proc = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", PROGRAM],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    _, stderr = proc.communicate()
+    if proc.returncode != 0:
+        sys.exit("Couldn't import unittest_mixins:\n" + stderr)
+    times = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            times.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return times
+
+
+def main(args):
+    runs = 10
+    max_us = None
+    while args:
+        arg = args.pop(0)
+        if arg == "--runs":
+            runs = int(args.pop(0))
+        elif arg == "--max-us":
+            max_us = int(args.pop(0))
+        else:
+            sys.exit(__doc__)
+
+    best = None
+    for _ in range(runs):
+        times = import_times()
+        cumulative = dict((module, cum) for module, _, cum, depth in times if depth == 0)
+        total = cumulative.get("unittest_mixins", 0) + cumulative.get("unittest_mixins.mixins", 0)
+        if best is None or total < best[0]:
+            best = (total, cumulative, times)
+
+    total, cumulative, times = best
+    print("Fastest of {0} runs:".format(runs))
+    print("  import unittest_mixins:     {0:8d} us".format(cumulative.get("unittest_mixins", 0)))
+    print("  load unittest_mixins.mixins: {0:7d} us".format(
+        cumulative.get("unittest_mixins.mixins", 0)
+    ))
+    print("  total:                      {0:8d} us".format(total))
+
+    # The modules imported on our behalf: everything after site is done.
+    ours = []
+    started = False
+    for module, self_us, cumulative_us, depth in times:
+        if module.startswith("unittest_mixins") and depth == 0:
+            started = True
+        if started:
+            ours.append((self_us, module))
+    print("Slowest modules (self time):")
+    for self_us, module in sorted(ours, reverse=True)[:10]:
+        print("  {0:8d} us  {1}".format(self_us, module))
+
+    if max_us is not None and total > max_us:
+        print("Too slow: {0} us is more than {1} us".format(total, max_us))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,267 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/nedbat/unittest-mixins/blob/master/NOTICE.txt
+
+"""Measure the overhead of the mixins.
+
+Run it like this::
+
+    python benchmarks/bench_mixins.py [--quick] [--label LABEL]
+        [--output FILE.json] [--compare OLD.json]
+
+These are measured:
+
+- The per-test overhead of each mixin, and of some common combinations,
+  compared to a plain unittest.TestCase.
+
+- ModuleCleaner, with different numbers of modules in sys.modules.
+
+- make_file throughput, for different numbers and sizes of files.
+
+- _Tee write throughput, for different sizes of text and binary writes.
+
+- How long _make_temp_dir and _delete_temp_dir take.
+
+Results are printed, and written as JSON with --output.  Use --compare to
+show how a run compares to an earlier JSON file, perhaps from another
+version.
+
+"""
+
+from __future__ import print_function
+
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import six
+
+from unittest_mixins import (
+    DelayedAssertionMixin,
+    EnvironmentAwareMixin,
+    ModuleAwareMixin,
+    ModuleCleaner,
+    StdStreamCapturingMixin,
+    SysPathAwareMixin,
+    TempDirMixin,
+    change_dir,
+    make_file,
+)
+from unittest_mixins.mixins import _CaptureStream, _Tee
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def best_time(func, repeat=5):
+    """Run `func()` `repeat` times, and return the fastest time in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = clock()
+        func()
+        elapsed = clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def test_class(*mixins, **attrs):
+    """Make a test class with `mixins`, and one empty test method."""
+    def test_nothing(self):
+        pass
+    attrs["test_nothing"] = test_nothing
+    name = "Bench_" + "_".join(m.__name__ for m in mixins)
+    return type(name, mixins + (unittest.TestCase,), attrs)
+
+
+MIXIN_CASES = [
+    ("ModuleAwareMixin", (ModuleAwareMixin,), {}),
+    ("SysPathAwareMixin", (SysPathAwareMixin,), {}),
+    ("EnvironmentAwareMixin", (EnvironmentAwareMixin,), {}),
+    ("EnvironmentAwareMixin snapshot", (EnvironmentAwareMixin,), {"snapshot_environ": True}),
+    ("StdStreamCapturingMixin", (StdStreamCapturingMixin,), {}),
+    ("DelayedAssertionMixin", (DelayedAssertionMixin,), {}),
+    ("TempDirMixin no temp dir", (TempDirMixin,), {"run_in_temp_dir": False}),
+    ("TempDirMixin", (TempDirMixin,), {"no_files_in_temp_dir": True}),
+    (
+        "Environment+StdStream+TempDir",
+        (EnvironmentAwareMixin, StdStreamCapturingMixin, TempDirMixin),
+        {"no_files_in_temp_dir": True},
+    ),
+]
+
+
+def run_tests(klass, count):
+    """Run the test in `klass` `count` times."""
+    suite = unittest.TestSuite([klass("test_nothing") for _ in range(count)])
+    result = unittest.TestResult()
+    suite.run(result)
+    assert result.wasSuccessful(), result.errors + result.failures
+
+
+def bench_per_test_overhead(tests):
+    """Microseconds of overhead per test for each mixin case."""
+    baseline = best_time(lambda: run_tests(test_class(), tests)) / tests
+    results = {"unittest.TestCase": baseline * 1e6}
+    for name, mixins, attrs in MIXIN_CASES:
+        klass = test_class(*mixins, **attrs)
+        per_test = best_time(lambda: run_tests(klass, tests)) / tests
+        TempDirMixin._class_behaviors.pop(klass, None)
+        results[name] = (per_test - baseline) * 1e6
+    return results
+
+
+def bench_module_cleaner(sizes):
+    """Microseconds for ModuleCleaner to clean up 10 new modules."""
+    results = {}
+    fake_module = sys.modules[__name__]
+    for size in sizes:
+        extra = ["bench_fake_module_{0}".format(i) for i in range(size - len(sys.modules))]
+        for name in extra:
+            sys.modules[name] = fake_module
+        try:
+            def clean():
+                cleaner = ModuleCleaner()
+                for i in range(10):
+                    sys.modules["bench_new_module_{0}".format(i)] = fake_module
+                cleaner.cleanup_modules()
+            results[str(len(sys.modules))] = best_time(clean) * 1e6
+        finally:
+            for name in extra:
+                del sys.modules[name]
+    return results
+
+
+def bench_make_file(counts, sizes):
+    """Files per second and megabytes per second for make_file."""
+    results = {}
+    for count in counts:
+        for size in sizes:
+            text = "x" * (size - 1) + "\n"
+            temp_dir = tempfile.mkdtemp(prefix="bench_make_file_")
+            try:
+                with change_dir(temp_dir):
+                    def make_files():
+                        for i in range(count):
+                            make_file("sub{0}/file{1}.txt".format(i % 10, i), text)
+                    elapsed = best_time(make_files, repeat=3)
+            finally:
+                shutil.rmtree(temp_dir)
+            results["{0} files of {1} bytes".format(count, size)] = {
+                "files_per_second": count / elapsed,
+                "mb_per_second": count * size / elapsed / 1e6,
+            }
+    return results
+
+
+def bench_tee(sizes, total):
+    """Megabytes per second written through a _Tee to a StringIO and a capture.
+
+    Text is written to the _Tee, and bytes to its binary layer.
+
+    """
+    results = {}
+    for size in sizes:
+        data = "x" * (size - 1) + "\n"
+        binary = data.encode("ascii")
+        writes = total // size
+
+        def write():
+            tee = _Tee(six.StringIO(), _CaptureStream())
+            for _ in range(writes):
+                tee.write(data)
+
+        def write_bytes():
+            tee = _Tee(six.StringIO(), _CaptureStream())
+            for _ in range(writes):
+                tee.buffer.write(binary)
+
+        results["{0}-byte writes".format(size)] = writes * size / best_time(write) / 1e6
+        results["{0}-byte binary writes".format(size)] = (
+            writes * size / best_time(write_bytes) / 1e6
+        )
+    return results
+
+
+def bench_temp_dirs(count):
+    """Microseconds to make and to delete a test's temp directory."""
+    klass = test_class(TempDirMixin, run_in_temp_dir=False)
+    tests = [klass("test_nothing") for _ in range(count)]
+
+    start = clock()
+    for test in tests:
+        test._make_temp_dir()
+    made = clock()
+    for test in tests:
+        test.doCleanups()
+    deleted = clock()
+    TempDirMixin._class_behaviors.pop(klass, None)
+    return {
+        "make_temp_dir": (made - start) / count * 1e6,
+        "delete_temp_dir": (deleted - made) / count * 1e6,
+    }
+
+
+def flatten(results, prefix=""):
+    """Produce (name, number) pairs from nested dicts of results."""
+    for key, value in sorted(results.items()):
+        name = prefix + key
+        if isinstance(value, dict):
+            for pair in flatten(value, name + " / "):
+                yield pair
+        else:
+            yield name, value
+
+
+def main(args):
+    quick = "--quick" in args
+    label = output = compare = None
+    if "--label" in args:
+        label = args[args.index("--label") + 1]
+    if "--output" in args:
+        output = args[args.index("--output") + 1]
+    if "--compare" in args:
+        compare = args[args.index("--compare") + 1]
+
+    results = {
+        "per_test_overhead_us": bench_per_test_overhead(tests=100 if quick else 500),
+        "module_cleaner_us": bench_module_cleaner(
+            [1000, 5000] if quick else [1000, 5000, 20000]
+        ),
+        "make_file": bench_make_file(
+            counts=[10, 100] if quick else [10, 100, 1000],
+            sizes=[100, 10000] if quick else [100, 10000, 1000000],
+        ),
+        "tee_mb_per_second": bench_tee([10, 1000, 100000], total=10000000 if quick else 50000000),
+        "temp_dir_us": bench_temp_dirs(count=20 if quick else 100),
+    }
+    report = {
+        "label": label,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    old = None
+    if compare:
+        with open(compare) as f:
+            old = dict(flatten(json.load(f)["results"]))
+
+    for name, value in flatten(results):
+        line = "{0:<70} {1:14.2f}".format(name, value)
+        if old is not None and old.get(name):
+            line += "  {0:6.2f}x".format(value / old[name])
+        print(line)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
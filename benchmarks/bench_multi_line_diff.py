@@ -0,0 +1,116 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/nedbat/unittest-mixins/blob/master/NOTICE.txt
+
+"""Benchmark the multi-line string diff used by DelayedAssertionMixin.
+
+Run it like this::
+
+    python benchmarks/bench_multi_line_diff.py [--ndiff] [SIZE ...]
+
+SIZEs are in bytes, with an optional K or M suffix.  The default sizes run
+from 1K to 100M.  With --ndiff, unittest's own assertMultiLineEqual is timed
+too, for sizes up to 10K (it is far too slow beyond that).
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import unittest
+
+from unittest_mixins.mixins import _render_multi_line_inequality
+
+DEFAULT_SIZES = ["1K", "10K", "100K", "1M", "10M", "100M"]
+
+# The largest size we'll try unittest's ndiff-based diff on.
+NDIFF_MAX_SIZE = 10000
+
+
+def parse_size(size):
+    """Convert "10K" or "3M" or "17" to a number of bytes."""
+    multiplier = 1
+    if size[-1] in "kK":
+        multiplier, size = 1000, size[:-1]
+    elif size[-1] in "mM":
+        multiplier, size = 1000000, size[:-1]
+    return int(size) * multiplier
+
+
+def make_text(size):
+    """Make about `size` bytes of numbered lines."""
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = "This is line number {0} of the text\n".format(i)
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return lines
+
+
+def cases(size):
+    """Produce (name, first, second) pairs of strings to compare."""
+    lines = make_text(size)
+    first = "".join(lines)
+
+    changed = list(lines)
+    changed[len(lines) // 2] = "A changed line\n"
+    yield "one line changed", first, "".join(changed)
+
+    changed = list(lines)
+    for i in range(0, len(lines), max(1, len(lines) // 10)):
+        changed[i] = "A changed line {0}\n".format(i)
+    yield "ten lines changed", first, "".join(changed)
+
+    yield "all lines changed", first, first.replace("line", "LINE")
+
+
+class NdiffTest(unittest.TestCase):
+    """A test case only used to run unittest's assertMultiLineEqual."""
+    maxDiff = None
+    # Always diff, however long the strings are.
+    _diffThreshold = sys.maxsize
+
+    def runTest(self):                                      # pragma: no cover
+        pass
+
+
+def time_it(func):
+    """Run `func()`, and return how many seconds it took."""
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def ndiff_message(first, second):
+    """Produce unittest's failure message for two strings."""
+    try:
+        NdiffTest().assertMultiLineEqual(first, second)
+    except AssertionError as exc:
+        return str(exc)
+
+
+def main(args):
+    use_ndiff = "--ndiff" in args
+    sizes = [a for a in args if not a.startswith("--")] or DEFAULT_SIZES
+    testcase = NdiffTest()
+
+    print("{0:>10} {1:<20} {2:>10} {3:>10}".format("size", "case", "fast", "ndiff"))
+    for size in sizes:
+        nbytes = parse_size(size)
+        for name, first, second in cases(nbytes):
+            fast = time_it(
+                lambda: _render_multi_line_inequality(testcase, first, second, None)
+            )
+            if use_ndiff and nbytes <= NDIFF_MAX_SIZE:
+                ndiff = "{0:10.4f}".format(time_it(lambda: ndiff_message(first, second)))
+            else:
+                ndiff = "{0:>10}".format("-")
+            print("{0:>10} {1:<20} {2:10.4f} {3}".format(size, name, fast, ndiff))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
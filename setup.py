@@ -31,9 +31,6 @@ setup(
     author_email='ned@nedbatchelder.com',
     url='https://github.com/nedbat/unittest-mixins',
     packages=['unittest_mixins'],
-    install_requires=[
-        'six >= 1.4.0',
-    ],
     license='Apache 2.0',
     classifiers=classifiers.splitlines(),
 )
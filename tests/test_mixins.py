@@ -5,13 +5,20 @@
 """Tests that our test infrastructure is really working!"""
 
 import contextlib
+import io
+import json
 import os
 import os.path
 import re
 import shutil
+import subprocess
 import sys
 import tempfile
 import textwrap
+import threading
+import time
+import types
+import warnings
 try:
     import unittest2 as unittest
 except ImportError:
@@ -19,16 +26,47 @@ except ImportError:
 
 import six
 
+from unittest_mixins import mixins
+from unittest_mixins.mixins import _MixinTimings, _report_on_budgets, _report_on_profiles
 from unittest_mixins import (
     change_dir,
+    ClassEnvironmentAwareMixin,
+    ClassModuleAwareMixin,
+    ClassSysPathAwareMixin,
     DelayedAssertionMixin,
     EnvironmentAwareMixin,
+    ForkIsolationMixin,
+    make_file,
+    mixin_timings,
     ModuleCleaner,
+    PerformanceBudgetMixin,
+    ProfilingMixin,
+    ResourceLeakMixin,
+    run_forked_tests,
+    run_python,
     StdStreamCapturingMixin,
     TempDirMixin,
 )
 
 
+class PackageTest(unittest.TestCase):
+    """Tests of the unittest_mixins package itself."""
+
+    def test_names(self):
+        import unittest_mixins
+        for name in unittest_mixins.__all__:
+            self.assertIn(name, dir(unittest_mixins))
+            self.assertIs(getattr(unittest_mixins, name), getattr(unittest_mixins.mixins, name))
+        with self.assertRaises(AttributeError):
+            unittest_mixins.xyzzy
+
+    def test_mixins_module_is_available(self):
+        code = "import unittest_mixins; print(unittest_mixins.mixins.make_file.__name__)"
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+        output = subprocess.check_output([sys.executable, "-c", code], env=env)
+        self.assertEqual(output.strip(), b"make_file")
+
+
 class ChangeDirTest(unittest.TestCase):
     """Test the change_dir decorator."""
     def setUp(self):
@@ -127,6 +165,354 @@ class TempDirMixinTest(TempDirMixin, unittest.TestCase):
             data = f.read()
         self.assertEqual(data, b"\x99\x33\x66hello\0")
 
+    def test_assert_file_content(self):
+        self.make_file("hello.txt", """\
+            Hello
+            Bye
+            """)
+        self.assert_file_content("hello.txt", text="""\
+            Hello
+            Bye
+            """)
+        self.assert_file_content("hello.txt", bytes=b"Hello\nBye\n")
+        self.assert_file_content("hello.txt", chunks=[b"Hel", b"", b"lo\nBye", b"\n"])
+        self.make_file("hello2.txt", "Hello\nBye\n")
+        self.assert_file_content("hello.txt", other_file="hello2.txt")
+
+    def test_assert_file_content_needs_one_expectation(self):
+        self.make_file("hello.txt", "Hello")
+        with self.assertRaises(ValueError):
+            self.assert_file_content("hello.txt")
+        with self.assertRaises(ValueError):
+            self.assert_file_content("hello.txt", text="Hello", bytes=b"Hello")
+
+    def test_assert_file_content_reports_first_difference(self):
+        lines = ["line {0}\n".format(i) for i in range(100000)]
+        self.make_file("big.txt", "".join(lines))
+        lines[50000] = "LINE 50000\n"
+        msg = re.escape(textwrap.dedent("""\
+            'big.txt' differs from expected at line 50001, byte offset 538890:
+              line 49997
+              line 49998
+              line 49999
+            - LINE 50000
+            + line 50000
+              line 50001
+              line 50002
+              line 50003
+            """))
+        with six.assertRaisesRegex(self, AssertionError, "^" + msg + "$"):
+            self.assert_file_content("big.txt", chunks=iter(lines))
+
+    def test_assert_file_content_large_expected_bytes(self):
+        # A large single chunk is read a piece at a time without copying the
+        # rest of it each time.
+        data = b"x" * (64 * 1024 * 1024 - 1) + b"\n"
+        self.make_file("large.dat", bytes=data)
+        self.assert_file_content("large.dat", bytes=data)
+        msg = "'large.dat' differs from expected at line 1, byte offset 67108862:"
+        with six.assertRaisesRegex(self, AssertionError, "^" + re.escape(msg)):
+            self.assert_file_content("large.dat", bytes=data[:-2] + b"y\n")
+
+    def test_assert_file_content_different_lengths(self):
+        self.make_file("short.txt", "one\ntwo\n")
+        msg = re.escape(textwrap.dedent("""\
+            'short.txt' differs from expected at line 3, byte offset 8:
+              one
+              two
+            - three
+            """))
+        with six.assertRaisesRegex(self, AssertionError, "^" + msg + "$"):
+            self.assert_file_content("short.txt", bytes=b"one\ntwo\nthree\n")
+
+
+class MakeTreeTest(TempDirMixin, unittest.TestCase):
+    """Tests of TempDirMixin.make_tree."""
+
+    def make_fixture(self):
+        """Make a fixture directory, and return its file names."""
+        self.make_file("fixture/setup.py", "# setup\n")
+        self.make_file("fixture/pkg/__init__.py", "")
+        self.make_file("fixture/pkg/mod.py", "x = 1\n")
+        self.make_file("fixture/data.bin", bytes=b"\x00\x01\x02")
+        return ["data.bin", "pkg/__init__.py", "pkg/mod.py", "setup.py"]
+
+    def check_tree(self, made, dest):
+        """Check that `made` lists the files of the fixture, and they're in `dest`."""
+        self.assertEqual(sorted(f.replace(os.sep, "/") for f in made), [
+            "data.bin", "pkg/__init__.py", "pkg/mod.py", "setup.py",
+        ])
+        self.assert_file_content(os.path.join(dest, "pkg/mod.py"), text="x = 1\n")
+        self.assert_file_content(os.path.join(dest, "data.bin"), bytes=b"\x00\x01\x02")
+
+    def test_from_directory(self):
+        self.make_fixture()
+        self.check_tree(self.make_tree("fixture", "project"), "project")
+
+    def test_from_archives(self):
+        import tarfile
+        import zipfile
+        names = self.make_fixture()
+        with tarfile.open("fixture.tar.gz", "w:gz") as tf:
+            tf.add("fixture", arcname=".")
+        with zipfile.ZipFile("fixture.zip", "w") as zf:
+            for name in names:
+                zf.write(os.path.join("fixture", name), name)
+
+        for archive in ["fixture.tar.gz", "fixture.zip"]:
+            self.check_tree(self.make_tree(archive, "from_" + archive), "from_" + archive)
+
+    def test_archives_are_extracted_once(self):
+        import tarfile
+        self.make_fixture()
+        with tarfile.open("fixture.tar", "w") as tf:
+            tf.add("fixture", arcname=".")
+        shutil.copy("fixture.tar", "same_fixture.tar")
+
+        extracted = []
+        real_extract = mixins._extract_archive
+
+        def counting_extract(archive, dest):
+            extracted.append(archive)
+            real_extract(archive, dest)
+
+        mixins._extract_archive = counting_extract
+        try:
+            self.make_tree("fixture.tar", "one")
+            self.make_tree("fixture.tar", "two")
+            self.make_tree("same_fixture.tar", "three")
+        finally:
+            mixins._extract_archive = real_extract
+
+        self.assertEqual(extracted, ["fixture.tar"])
+        for dest in ["one", "two", "three"]:
+            self.assert_file_content(os.path.join(dest, "setup.py"), text="# setup\n")
+
+    def test_hardlinks(self):
+        self.make_fixture()
+        self.make_tree("fixture", "linked", hardlink=True)
+        self.make_tree("fixture", "copied")
+        original = os.stat("fixture/pkg/mod.py")
+        self.assertEqual(os.stat("linked/pkg/mod.py").st_ino, original.st_ino)
+        self.assertNotEqual(os.stat("copied/pkg/mod.py").st_ino, original.st_ino)
+
+    def test_unsafe_tar(self):
+        import tarfile
+        self.make_file("evil.txt", "Boo!")
+        with tarfile.open("evil.tar", "w") as tf:
+            tf.add("evil.txt", arcname="../evil.txt")
+        with six.assertRaisesRegex(self, ValueError, r"Unsafe path in 'evil.tar'"):
+            self.make_tree("evil.tar", "dest")
+
+        with tarfile.open("link.tar", "w") as tf:
+            info = tarfile.TarInfo("passwd")
+            info.type = tarfile.SYMTYPE
+            info.linkname = "/etc/passwd"
+            tf.addfile(info)
+        with six.assertRaisesRegex(self, ValueError, r"Unsafe link in 'link.tar'"):
+            self.make_tree("link.tar", "dest")
+
+    def test_not_an_archive(self):
+        self.make_file("nope.txt", "Just text")
+        with six.assertRaisesRegex(self, ValueError, r"Not a tar or zip file: 'nope.txt'"):
+            self.make_tree("nope.txt")
+
+
+class CachedFixturesTest(EnvironmentAwareMixin, TempDirMixin, unittest.TestCase):
+    """Tests of TempDirMixin.cached_fixtures."""
+
+    def run_fixture_tests(self, version="1", cache="cache", hardlinks=False):
+        """Run a test with cached fixtures.
+
+        Returns a list of what happened: "built" when the builder made files,
+        and whether the files came from the cache.
+
+        """
+        happened = []
+        fixture_dir = os.path.join(self.temp_dir, "fixture")
+
+        class _FixtureTests(TempDirMixin, unittest.TestCase):
+            fixture_cache_dir = cache and os.path.join(self.temp_dir, cache)
+            make_tree_hardlinks = hardlinks
+
+            def build(self):
+                self.make_file("main.py", "VERSION = {0}\n".format(version))
+                self.make_file("pkg/data.txt", "data")
+                self.make_tree(fixture_dir, "tree")
+                if not self._fixture_hasher:
+                    happened.append("built")
+
+            def test_fixtures(self):
+                happened.append(self.cached_fixtures(self.build))
+                self.assert_file_content("main.py", text="VERSION = {0}\n".format(version))
+                self.assert_file_content("pkg/data.txt", text="data")
+                self.assert_file_content("tree/one.txt", text="one")
+                # Changing a file doesn't change the cache.
+                with open("main.py", "a") as f:
+                    f.write("# changed\n")
+
+        # Avoid nested class names in the test ids, as in
+        # test_tests_are_in_distinct_temp_dirs.
+        FixtureTests = type("FixtureTests", (_FixtureTests,), {})
+
+        results = run_tests_from_class(FixtureTests)
+        TempDirMixin._class_behaviors.pop(FixtureTests)
+        assert_all_passed(results, tests_run=1)
+        return happened
+
+    def test_cached_fixtures(self):
+        self.make_file("fixture/one.txt", "one")
+        self.assertEqual(self.run_fixture_tests(), ["built", False])
+        self.assertEqual(self.run_fixture_tests(), [True])
+
+        # Changing what the builder makes invalidates the cache.
+        self.assertEqual(self.run_fixture_tests(version="2"), ["built", False])
+        self.assertEqual(self.run_fixture_tests(version="2"), [True])
+        entries = os.listdir("cache/tests_test_mixins_FixtureTests_test_fixtures")
+        self.assertEqual(len(entries), 1)
+
+        # So does changing a tree it copies.
+        self.make_file("fixture/one.txt", "one")
+        os.utime("fixture/one.txt", (1, 1))
+        self.assertEqual(self.run_fixture_tests(version="2"), ["built", False])
+
+    def test_cache_is_copied_even_with_hardlinks(self):
+        self.make_file("fixture/one.txt", "one")
+        self.assertEqual(self.run_fixture_tests(hardlinks=True), ["built", False])
+        self.assertEqual(self.run_fixture_tests(hardlinks=True), [True])
+        self.assertEqual(self.run_fixture_tests(hardlinks=True), [True])
+
+    def test_relative_cache_dir(self):
+        self.make_file("fixture/one.txt", "one")
+        # Relative to where the tests start, not to their temp directories.
+        self.set_environ("UNITTEST_MIXINS_FIXTURE_CACHE", ".fixture_cache")
+        self.assertEqual(self.run_fixture_tests(cache=None), ["built", False])
+        self.assertEqual(self.run_fixture_tests(cache=None), [True])
+        self.assertTrue(os.path.isdir(
+            ".fixture_cache/tests_test_mixins_FixtureTests_test_fixtures"
+        ))
+
+    def test_no_cache(self):
+        self.make_file("fixture/one.txt", "one")
+        self.del_environ("UNITTEST_MIXINS_FIXTURE_CACHE")
+        self.assertEqual(self.run_fixture_tests(cache=None), ["built", False])
+        self.assertEqual(self.run_fixture_tests(cache=None), ["built", False])
+
+
+class TempDirQuotaTest(EnvironmentAwareMixin, unittest.TestCase):
+    """Tests of TempDirMixin.temp_dir_quota."""
+
+    def run_quota_tests(self, quota):
+        """Run tests that use a lot of space, with a quota, and return the results."""
+        class QuotaTests(TempDirMixin, unittest.TestCase):
+            temp_dir_quota = quota
+
+            def test_make_file(self):
+                self.make_file("small.txt", "x" * 100)
+                self.make_file("medium.txt", "x" * 500)
+                # Re-writing a file only counts the new size.
+                self.make_file("medium.txt", "x" * 600)
+                self.make_file("large.txt", "x" * 1000)
+
+            def test_other_writes(self):
+                self.make_file("small.txt", "x" * 100)
+                with open("huge.dat", "wb") as f:
+                    f.write(b"x" * 5000)
+
+        results = run_tests_from_class(QuotaTests)
+        TempDirMixin._class_behaviors.pop(QuotaTests)
+        return results
+
+    def test_no_quota(self):
+        self.del_environ("UNITTEST_MIXINS_TEMP_DIR_QUOTA")
+        assert_all_passed(self.run_quota_tests(None), tests_run=2)
+
+    def test_under_quota(self):
+        assert_all_passed(self.run_quota_tests(10000), tests_run=2)
+
+    def test_over_quota(self):
+        results = self.run_quota_tests(1500)
+        self.assertEqual(results.testsRun, 2)
+        failures = cleanup_failures(results)
+        self.assertEqual(len(failures), 2)
+
+        # make_file fails before the file is written.
+        self.assertIn(
+            "make_file('large.txt') used 1700 bytes in its temp directory, "
+            "over the quota of 1500.  Largest files:\n"
+            "            1000  large.txt\n"
+            "             600  medium.txt\n"
+            "             100  small.txt\n",
+            failures["test_make_file"],
+        )
+
+        # Other writes are found when the test is done.
+        self.assertIn(
+            "The test used 5100 bytes in its temp directory, "
+            "over the quota of 1500.  Largest files:\n"
+            "            5000  huge.dat\n"
+            "             100  small.txt\n",
+            failures["test_other_writes"],
+        )
+
+    def test_quota_from_environment(self):
+        self.set_environ("UNITTEST_MIXINS_TEMP_DIR_QUOTA", "1500")
+        results = self.run_quota_tests(None)
+        self.assertEqual(len(cleanup_failures(results)), 2)
+
+
+class RunPythonTest(EnvironmentAwareMixin, TempDirMixin, unittest.TestCase):
+    """Tests of TempDirMixin.run_python."""
+
+    def test_run_python(self):
+        self.make_file("helper.py", "VALUE = 'from helper'")
+        self.make_file("sub/script.py", """\
+            import os, sys
+            import helper
+            print(helper.VALUE)
+            print(os.path.basename(os.getcwd()) == os.path.basename(sys.argv[1]))
+            print(sys.argv[2:])
+            print(os.environ["XYZZY_PLUGH"])
+            sys.stderr.write("Oops\\n")
+            sys.exit(3)
+            """)
+        self.set_environ("XYZZY_PLUGH", "Vogon")
+        status, stdout, stderr = self.run_python("sub/script.py", [self.temp_dir, "a", "b"])
+        self.assertEqual(status, 3)
+        self.assertEqual(stdout, "from helper\nTrue\n['a', 'b']\nVogon\n")
+        self.assertEqual(stderr, "Oops\n")
+
+    def test_run_python_exception(self):
+        self.make_file("boom.py", "1/0")
+        status, stdout, stderr = self.run_python("boom.py")
+        self.assertEqual(status, 1)
+        self.assertEqual(stdout, "")
+        self.assertIn("ZeroDivisionError", stderr)
+
+    def test_run_python_is_like_python(self):
+        self.make_file("sub/script.py", """\
+            from __future__ import print_function
+            import atexit, sys
+            atexit.register(lambda: print("at exit"))
+            print(sys.argv[0])
+            print([name for name in ["base64", "json", "tempfile"] if name in sys.modules])
+            print("hi")
+            """)
+        status, stdout, stderr = self.run_python("sub/script.py")
+        self.assertEqual(stderr, "")
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, "sub/script.py\n[]\nhi\nat exit\n")
+
+    def test_each_run_is_fresh(self):
+        self.make_file("counter.py", """\
+            import sys
+            sys.counter = getattr(sys, "counter", 0) + 1
+            print(sys.counter)
+            """)
+        for _ in range(3):
+            status, stdout, _ = self.run_python("counter.py")
+            self.assertEqual((status, stdout), (0, "1\n"))
+
 
 class EnvironmentAwareMixinTest(EnvironmentAwareMixin, unittest.TestCase):
     """Tests of test_helpers.EnvironmentAwareMixin."""
@@ -214,6 +600,45 @@ class EnvironmentAwareMixinTest(EnvironmentAwareMixin, unittest.TestCase):
         self.assertNotIn("XYZZY_PLUGH", os.environ)
 
 
+class EnvironmentAwareMixinBulkTest(EnvironmentAwareMixin, unittest.TestCase):
+    """Tests of the bulk methods in EnvironmentAwareMixin."""
+
+    def setUp(self):
+        super(EnvironmentAwareMixinBulkTest, self).setUp()
+        self.assertNotIn("XYZZY_PLUGH", os.environ)
+        self.assertNotIn("XYZZY_QUUX", os.environ)
+
+    def test_update_environ(self):
+        self.set_environ("XYZZY_QUUX", "Before")
+        self.update_environ({"XYZZY_PLUGH": "Vogon", "XYZZY_QUUX": None})
+        self.assertEqual(os.environ["XYZZY_PLUGH"], "Vogon")
+        self.assertNotIn("XYZZY_QUUX", os.environ)
+        self.doCleanups()
+        self.assertNotIn("XYZZY_PLUGH", os.environ)
+        self.assertNotIn("XYZZY_QUUX", os.environ)
+
+    def test_patched_environ(self):
+        self.set_environ("XYZZY_QUUX", "Before")
+        with self.patched_environ({"XYZZY_PLUGH": "Vogon", "XYZZY_QUUX": None}):
+            self.assertEqual(os.environ["XYZZY_PLUGH"], "Vogon")
+            self.assertNotIn("XYZZY_QUUX", os.environ)
+        self.assertNotIn("XYZZY_PLUGH", os.environ)
+        self.assertEqual(os.environ["XYZZY_QUUX"], "Before")
+
+    def test_snapshot_environ(self):
+        class SnapshotTest(EnvironmentAwareMixin, unittest.TestCase):
+            snapshot_environ = True
+
+            def test_mess_up_the_environment(self):
+                os.environ["XYZZY_PLUGH"] = "Vogon"
+                del os.environ["PATH"]
+
+        results = run_tests_from_class(SnapshotTest)
+        assert_all_passed(results, tests_run=1)
+        self.assertNotIn("XYZZY_PLUGH", os.environ)
+        self.assertIn("PATH", os.environ)
+
+
 class DelayedAssertionMixinTest(DelayedAssertionMixin, unittest.TestCase):
     """Test the `delayed_assertions` method."""
 
@@ -260,6 +685,249 @@ class DelayedAssertionMixinTest(DelayedAssertionMixin, unittest.TestCase):
             self.assertEqual("x", "x")
             self.assertEqual("y", "y")
 
+    def test_failures_are_rendered_late(self):
+        # Failed comparisons are recorded as operands, not messages:
+        with self.assertRaises(AssertionError):
+            with self.delayed_assertions():
+                self.assertEqual("x", "y")
+                failure, = self._delayed_assertions
+                self.assertEqual(failure.kind, "assertMultiLineEqual")
+                self.assertEqual(failure.operands, ("x", "y", None))
+
+    def test_failure_size_cap(self):
+        self.delayed_failure_max_size = 20
+        msg = (
+            re.escape("'x' != 'y'\n- x\n+ y\n\n") +
+            r"[\s\S]{20}" + re.escape("\n[... ") + r"\d+" + re.escape(" more characters]")
+        )
+        with six.assertRaisesRegex(self, AssertionError, msg):
+            with self.delayed_assertions():
+                self.assertEqual("x", "y")
+                self.assertEqual("x\n" * 100, "y\n" * 100)
+
+    def test_total_size_cap(self):
+        self.delayed_total_max_size = 1
+        msg = re.escape(textwrap.dedent("""\
+            3 failed assertions:
+            'x' != 'y'
+            - x
+            + y
+
+            [... 2 more failed assertions]"""))
+        with six.assertRaisesRegex(self, AssertionError, msg):
+            with self.delayed_assertions():
+                self.assertEqual("x", "y")
+                self.assertEqual("w", "z")
+                self.assertEqual("a", "b")
+
+    def test_zero_total_size_still_shows_a_failure(self):
+        self.delayed_total_max_size = 0
+        self.delayed_failure_max_size = 3
+        msg = re.escape(textwrap.dedent("""\
+            'x'
+            [... 16 more characters]
+            Failed at:
+            """))
+        with six.assertRaisesRegex(self, AssertionError, "^" + msg):
+            with self.delayed_assertions():
+                self.assertEqual("x", "y")
+        msg = re.escape(textwrap.dedent("""\
+            2 failed assertions:
+            'x'
+            [... 16 more characters]
+            [... 1 more failed assertions]
+            """))
+        with six.assertRaisesRegex(self, AssertionError, "^" + msg):
+            with self.delayed_assertions():
+                self.assertEqual("x", "y")
+                self.assertEqual("w", "z")
+
+    def assert_even(self, n):
+        """A custom assertion, which should be delayed also."""
+        assert n % 2 == 0, "{0} is odd".format(n)
+
+    def test_all_kinds_of_assertions(self):
+        with self.assertRaises(AssertionError) as cm:
+            with self.delayed_assertions():
+                self.assertTrue(False)
+                self.assertIn(3, [1, 2])
+                with self.assertRaises(ValueError):
+                    pass
+                self.assertRaises(ValueError, lambda: None)
+                self.assert_even(17)
+                self.assertEqual(1, 2)
+        message = str(cm.exception)
+        self.assertTrue(message.startswith("6 failed assertions:\n"))
+        for expected in [
+            "False is not true",
+            "3 not found in [1, 2]",
+            "ValueError not raised",
+            "17 is odd",
+            "1 != 2",
+        ]:
+            self.assertIn(expected, message)
+
+    def test_failure_locations(self):
+        with self.assertRaises(AssertionError) as cm:
+            with self.delayed_assertions():
+                line = sys._getframe().f_lineno + 1
+                self.assertTrue(False)
+                self.assertIn(3, [1, 2])
+        locations = str(cm.exception).partition("Failed at:\n")[2].split()
+        self.assertEqual(locations, [
+            "{0}:{1}".format(__file__.replace(".pyc", ".py"), line),
+            "{0}:{1}".format(__file__.replace(".pyc", ".py"), line + 1),
+        ])
+
+    def test_max_failures(self):
+        checked = []
+        with self.assertRaises(AssertionError) as cm:
+            with self.delayed_assertions(max_failures=3):
+                for i in range(10):
+                    checked.append(i)
+                    self.assertLess(i, 5)
+        self.assertEqual(checked, [0, 1, 2, 3, 4, 5, 6, 7])
+        message = str(cm.exception)
+        self.assertTrue(message.startswith("3 failed assertions:\n"))
+        self.assertIn("[stopped after 3 failed assertions]", message)
+
+    def test_max_failures_is_not_swallowed(self):
+        checked = []
+        with self.assertRaises(AssertionError) as cm:
+            with self.delayed_assertions(max_failures=2):
+                for i in range(10):
+                    try:
+                        checked.append(i)
+                        self.assertLess(i, 5)
+                    except Exception:
+                        pass
+        self.assertEqual(checked, [0, 1, 2, 3, 4, 5, 6])
+        self.assertIn("[stopped after 2 failed assertions]", str(cm.exception))
+
+    def test_assertions_inside_assert_raises_are_not_delayed(self):
+        with self.delayed_assertions():
+            with self.assertRaises(AssertionError):
+                self.assertEqual("x", "y")
+            self.assertRaises(AssertionError, self.assertTrue, False)
+
+    def test_assert_raises_context_attributes(self):
+        with self.delayed_assertions():
+            ctx = self.assertRaises(ValueError)
+            with ctx:
+                raise ValueError("xyzzy")
+            self.assertEqual(str(ctx.exception), "xyzzy")
+
+    def test_methods_are_restored(self):
+        with self.delayed_assertions():
+            self.assertIn("assertTrue", self.__dict__)
+        self.assertNotIn("assertTrue", self.__dict__)
+        with self.assertRaises(AssertionError):
+            self.assertTrue(False)
+
+    def test_only_changed_lines_are_diffed(self):
+        first = "".join("line {0}\n".format(i) for i in range(20))
+        second = first.replace("line 10\n", "line ten\n")
+        msg = re.escape(textwrap.dedent("""\
+            [... 7 unchanged lines]
+              line 7
+              line 8
+              line 9
+            - line 10
+            + line ten
+              line 11
+              line 12
+              line 13
+            [... 6 unchanged lines]
+            """))
+        with six.assertRaisesRegex(self, AssertionError, msg):
+            self.assertMultiLineEqual(first, second)
+
+    def check_diff(self, first, second, diff):
+        """Check that assertMultiLineEqual(first, second) fails with `diff`."""
+        with self.assertRaises(AssertionError) as cm:
+            self.assertMultiLineEqual(first, second)
+        self.assertTrue(str(cm.exception).endswith("\n" + textwrap.dedent(diff)))
+
+    def test_indentation_changes_are_diffed_by_line(self):
+        self.check_diff("a\nb\nc\n", "a\n  b\nc\n", """\
+              a
+            - b
+            +   b
+              c
+            """)
+
+    def test_insertion_at_the_start_of_a_line(self):
+        self.check_diff("a\nq\nB\n", "a\nr\nxB\n", """\
+              a
+            - q
+            + r
+            - B
+            + xB
+            ? +
+            """)
+        self.check_diff("a\nb\n", "a\nxb\n", """\
+              a
+            - b
+            + xb
+            ? +
+            """)
+
+    def test_missing_final_newline_is_marked(self):
+        first = "".join("line {0}\n".format(i) for i in range(1000))
+        self.check_diff(first, first[:-1], """\
+            [... 996 unchanged lines]
+              line 996
+              line 997
+              line 998
+              line 999
+            + \\ No newline at end of file
+            """)
+        self.check_diff("a\nb", "a\nc\n", """\
+              a
+            + c
+            - b
+            - \\ No newline at end of file
+            """)
+
+    def test_long_changes_get_a_plain_diff(self):
+        lines = ["line {0}\n".format(i) for i in range(5000)]
+        first = "".join(lines)
+        lines[1000] = "changed 1000\n"
+        lines[4000] = "changed 4000\n"
+        second = "".join(lines)
+        msg = re.escape(textwrap.dedent("""\
+            [... 997 unchanged lines]
+              line 997
+              line 998
+              line 999
+            - line 1000
+            + changed 1000
+              line 1001
+              line 1002
+              line 1003
+            [... 2993 unchanged lines]
+              line 3997
+              line 3998
+              line 3999
+            - line 4000
+            + changed 4000
+              line 4001
+              line 4002
+              line 4003
+            [... 996 unchanged lines]
+            """))
+        with six.assertRaisesRegex(self, AssertionError, msg):
+            with self.delayed_assertions():
+                self.assertEqual(first, second)
+
+    def test_long_unrelated_strings_arent_diffed(self):
+        first = "".join("a{0}\n".format(i) for i in range(20000))
+        second = "".join("b{0}\n".format(i) for i in range(20000))
+        msg = re.escape("[diff omitted: 20000 and 20000 distinct lines, 0 in common]")
+        with six.assertRaisesRegex(self, AssertionError, msg):
+            with self.delayed_assertions():
+                self.assertEqual(first, second)
+
 
 def run_tests_from_class(klass):
     """Run the unittest tests in klass, and return a TestResult."""
@@ -277,6 +945,18 @@ def assert_all_passed(results, tests_run=None):
     assert results.skipped == []
 
 
+def cleanup_failures(results):
+    """A dict of test method names to the messages of their failures.
+
+    Python 2 reports a failed assertion in a cleanup function as an error, not
+    a failure, so errors are included.
+
+    """
+    return dict(
+        (test._testMethodName, msg) for test, msg in results.failures + results.errors
+    )
+
+
 class RunTestsFromClassTest(unittest.TestCase):
     """Tests of the run_tests_from_class function."""
 
@@ -333,6 +1013,148 @@ class StdStreamCapturingMixinTest(unittest.TestCase):
         self.assertIn(my_stdout.getvalue(), "Xyzzy")
         self.assertIn(my_stderr.getvalue(), "Plugh")
 
+    def test_bytes(self):
+        class TheTestsToTest(StdStreamCapturingMixin, unittest.TestCase):
+            def test_stdout_buffer(self):
+                sys.stdout.write(u"Hello, ")
+                sys.stdout.flush()
+                sys.stdout.buffer.write(b"w\xc3\xb6rld")
+                sys.stdout.write(u"!\n")
+                self.assertEqual(self.stdout_bytes(), b"Hello, w\xc3\xb6rld!\n")
+                if six.PY3:
+                    self.assertEqual(self.stdout(), u"Hello, w\xf6rld!\n")
+
+            def test_stderr_buffer(self):
+                sys.stderr.buffer.write(b"\x00\xff\x01")
+                sys.stderr.write(u"\u2603")
+                self.assertEqual(self.stderr_bytes(), b"\x00\xff\x01\xe2\x98\x83")
+                self.assertEqual(self.stdout_bytes(), b"")
+
+            def test_split_characters(self):
+                # Text is decoded lazily, even if a character is split
+                # across writes.
+                sys.stdout.buffer.write(b"x\xe2\x98")
+                self.assertIn("x", self.stdout())
+                sys.stdout.buffer.write(b"\x83y")
+                if six.PY3:
+                    self.assertEqual(self.stdout(), u"x\u2603y")
+
+        old_stdout = sys.stdout
+        old_stderr = sys.stderr
+        self.addCleanup(self._cleanup_streams, old_stdout, old_stderr)
+        sys.stdout = my_stdout = six.StringIO()
+        sys.stderr = six.StringIO()
+
+        results = run_tests_from_class(TheTestsToTest)
+        assert_all_passed(results, tests_run=3)
+
+        # Streams without a binary layer get the bytes as text.
+        self.assertIn(u"Hello, w\xf6rld!\n", my_stdout.getvalue())
+        self.assertIn(u"x\u2603y", my_stdout.getvalue())
+
+    def test_captured_streams_are_like_stringio(self):
+        class TheTestsToTest(StdStreamCapturingMixin, unittest.TestCase):
+            def test_file_methods(self):
+                self.assertFalse(sys.stderr.closed)
+                with self.assertRaises(io.UnsupportedOperation):
+                    sys.stderr.fileno()
+                self.assertFalse(sys.stderr.isatty())
+
+            def test_write_needs_a_string(self):
+                with self.assertRaises(TypeError):
+                    sys.stderr.write(17)
+                if six.PY3:
+                    with self.assertRaises(TypeError):
+                        sys.stderr.write(b"bytes")
+                    sys.stderr.buffer.write(b"bytes\n")
+                else:
+                    sys.stderr.write(b"bytes\n")
+                self.assertEqual(self.stderr(), "bytes\n")
+                # As with StringIO, writing unicode gives us unicode.
+                sys.stderr.write(u"\u2603\n")
+                self.assertEqual(self.stderr(), u"bytes\n\u2603\n")
+                self.assertIsInstance(self.stderr(), six.text_type)
+
+            def test_truncate(self):
+                sys.stderr.write(u"Hello, w\xf6rld\n")
+                sys.stderr.truncate(0)
+                sys.stderr.seek(0)
+                sys.stderr.write(u"Bye\n")
+                self.assertEqual(self.stderr(), "Bye\n")
+
+                # Writing over part of what's there.
+                where = sys.stderr.tell()
+                sys.stderr.write("Later\n")
+                sys.stderr.seek(where)
+                sys.stderr.write("Soon")
+                self.assertEqual(self.stderr(), "Bye\nSoonr\n")
+                sys.stderr.seek(0, 2)
+                sys.stderr.write("End\n")
+                self.assertEqual(self.stderr_bytes(), b"Bye\nSoonr\nEnd\n")
+
+        results = run_tests_from_class(TheTestsToTest)
+        assert_all_passed(results, tests_run=3)
+
+    def test_instrumented(self):
+        class _InstrumentedTests(StdStreamCapturingMixin, unittest.TestCase):
+            instrument_capture = True
+
+            def test_chatty(self):
+                for _ in range(10):
+                    sys.stdout.write("Hello\n")
+                sys.stdout.buffer.write(b"bytes\n")
+                sys.stderr.write(u"Oops \u2603\n")
+                self.assertEqual(self.stdout(), "Hello\n" * 10 + "bytes\n")
+                self.assertEqual(self.stderr(), u"Oops \u2603\n")
+                # Instrumenting stderr doesn't change what kind of stream it is.
+                self.assertFalse(sys.stderr.isatty())
+                self.assertFalse(sys.stderr.closed)
+                self.assertEqual(sys.stderr.tell(), 9)
+                with self.assertRaises(io.UnsupportedOperation):
+                    sys.stderr.fileno()
+
+            def test_quiet(self):
+                pass
+
+        # Avoid nested class names in the test ids, as in
+        # test_tests_are_in_distinct_temp_dirs.
+        InstrumentedTests = type("InstrumentedTests", (_InstrumentedTests,), {})
+
+        old_stdout = sys.stdout
+        old_stderr = sys.stderr
+        self.addCleanup(self._cleanup_streams, old_stdout, old_stderr)
+        sys.stdout = my_stdout = six.StringIO()
+        sys.stderr = six.StringIO()
+        self.addCleanup(mixins._capture_stats.clear)
+
+        results = run_tests_from_class(InstrumentedTests)
+        assert_all_passed(results, tests_run=2)
+        self.assertEqual(my_stdout.getvalue(), "Hello\n" * 10 + "bytes\n")
+
+        chatty = mixins._capture_stats["tests.test_mixins.InstrumentedTests.test_chatty"]
+        self.assertEqual(chatty["stdout"]["writes"], 11)
+        self.assertEqual(chatty["stdout"]["bytes"], 66)
+        self.assertGreater(chatty["stdout"]["capture_time"], 0)
+        self.assertGreater(chatty["stdout"]["terminal_time"], 0)
+        self.assertGreaterEqual(
+            chatty["stdout"]["total_time"],
+            chatty["stdout"]["capture_time"] + chatty["stdout"]["terminal_time"],
+        )
+        self.assertEqual(chatty["stderr"]["writes"], 1)
+        # The snowman is three bytes in UTF-8.
+        self.assertEqual(chatty["stderr"]["bytes"], 9)
+        self.assertEqual(chatty["stderr"]["terminal_time"], 0)
+        quiet = mixins._capture_stats["tests.test_mixins.InstrumentedTests.test_quiet"]
+        self.assertEqual(quiet["stdout"]["writes"], 0)
+
+        report = mixins._capture_stats_report()
+        six.assertRegex(
+            self, report,
+            r"(?m)^ +11 +66 .* stdout +tests.test_mixins.InstrumentedTests.test_chatty$",
+        )
+        six.assertRegex(self, report, r"(?m)^ +1 +9 .* stderr +TOTAL$")
+        self.assertNotIn("test_quiet", report)
+
     def _cleanup_streams(self, stdout, stderr):
         sys.stdout = stdout
         sys.stderr = stderr
@@ -449,6 +1271,66 @@ class ClassBehaviorTest(unittest.TestCase):
         behavior = self.run_and_get_behavior(MadeOneFile)
         self.assertIsNone(behavior.badness())
 
+    def test_file_accounting(self):
+        class MadeSomeFiles(TempDirMixin, unittest.TestCase):
+            # With a quota, the temp dir is scanned, and finds all the files.
+            temp_dir_quota = 100000
+
+            def test_one(self):
+                self.make_file("one.txt", "Hello")
+                self.make_file("sub/two.txt", "Hello there")
+
+            def test_two(self):
+                self.make_file("three.txt", bytes=b"x" * 100)
+                with open("not_by_make_file.txt", "w") as f:
+                    f.write("y" * 1000)
+
+            def test_three(self):
+                pass
+
+        behavior = self.run_and_get_behavior(MadeSomeFiles)
+        self.assertEqual(behavior.files_made, 3)
+        self.assertEqual(behavior.bytes_written, 116)
+        self.assertEqual(behavior.tests_making_files, 2)
+        self.assertEqual(behavior.peak_temp_dir_size, 1100)
+        self.assertGreater(behavior.temp_dir_time, 0)
+        self.assertGreater(behavior.test_time, 0)
+
+        info = behavior.as_dict()
+        self.assertEqual(info["class"], "tests.test_mixins.MadeSomeFiles")
+        self.assertEqual(info["files_made"], 3)
+        self.assertIsNone(info["badness"])
+
+    def test_peak_size_without_scanning(self):
+        # With no quota and no JSON report, only files made with make_file
+        # count toward the peak size.
+        class MadeUncountedFiles(TempDirMixin, unittest.TestCase):
+            def test_one(self):
+                self.make_file("one.txt", bytes=b"x" * 100)
+                self.make_file("one.txt", bytes=b"x" * 60)
+                self.make_file("two.txt", bytes=b"x" * 40)
+                with open("not_by_make_file.txt", "w") as f:
+                    f.write("y" * 1000)
+
+        self.assertIsNone(os.environ.get("UNITTEST_MIXINS_CLASS_BEHAVIOR"))
+        behavior = self.run_and_get_behavior(MadeUncountedFiles)
+        self.assertEqual(behavior.bytes_written, 200)
+        self.assertEqual(behavior.peak_temp_dir_size, 100)
+
+    def test_slow_temp_dirs(self):
+        behavior = TempDirMixin._ClassBehavior()
+        behavior.klass = ClassBehaviorTest
+        behavior.tests = behavior.tests_making_files = 10
+        behavior.temp_dir_time = 2.0
+        behavior.test_time = 0.25
+        self.assertEqual(
+            behavior.badness(),
+            "Slow temp dirs: ClassBehaviorTest spent 2.000s on temp directories, "
+            "0.250s in 10 tests"
+        )
+        behavior.test_time = 1.0
+        self.assertIsNone(behavior.badness())
+
     def test_made_no_files(self):
         class MadeNoFiles(TempDirMixin, unittest.TestCase):
             def test_pass(self):
@@ -603,3 +1485,634 @@ class ModuleCleanerMixinTest(TempDirMixin, unittest.TestCase):
             self.make_file("xyzzy.py", "A = 42")
             import xyzzy
             self.assertEqual(xyzzy.A, 42)
+
+
+def make_class_scoped_tests(verify):
+    """Make a test class using the class-scoped mixins, and a list of what it saw."""
+    seen = []
+
+    class ClassScopedTests(
+        ClassModuleAwareMixin, ClassSysPathAwareMixin, ClassEnvironmentAwareMixin,
+        unittest.TestCase
+    ):
+        verify_class_snapshot = verify
+
+        def test_1_change(self):
+            sys.modules["xyzzy_class_scoped"] = types.ModuleType("xyzzy_class_scoped")
+            sys.path.append("/xyzzy/class_scoped")
+            os.environ["XYZZY_CLASS_SCOPED"] = "yes"
+
+        def test_2_look(self):
+            seen.append((
+                "xyzzy_class_scoped" in sys.modules,
+                "/xyzzy/class_scoped" in sys.path,
+                "XYZZY_CLASS_SCOPED" in os.environ,
+            ))
+
+    return ClassScopedTests, seen
+
+
+class ClassScopedMixinsTest(unittest.TestCase):
+    """Tests of ClassModuleAwareMixin, ClassSysPathAwareMixin, and ClassEnvironmentAwareMixin."""
+
+    def check_restored(self):
+        self.assertNotIn("xyzzy_class_scoped", sys.modules)
+        self.assertNotIn("/xyzzy/class_scoped", sys.path)
+        self.assertNotIn("XYZZY_CLASS_SCOPED", os.environ)
+
+    def test_restored_after_class(self):
+        klass, seen = make_class_scoped_tests(verify=False)
+        assert_all_passed(run_tests_from_class(klass), tests_run=2)
+        # The second test saw the changes from the first, but they were
+        # undone at the end of the class.
+        self.assertEqual(seen, [(True, True, True)])
+        self.check_restored()
+
+    def test_verify_class_snapshot(self):
+        klass, seen = make_class_scoped_tests(verify=True)
+        assert_all_passed(run_tests_from_class(klass), tests_run=2)
+        # The changes were undone after the first test.
+        self.assertEqual(seen, [(False, False, False)])
+        self.check_restored()
+
+
+class MixinTimingsTest(unittest.TestCase):
+    """Tests of the setUp and cleanup timings of the mixins."""
+
+    def test_timings_are_per_test(self):
+        timings = _MixinTimings()
+        timings.add("AMixin", "setup", "test_one", 0.25)
+        timings.add("AMixin", "setup", "test_one", 0.5)
+        timings.add("AMixin", "setup", "test_two", 0.5)
+        timings.add("AMixin", "cleanup", "test_two", 2.0)
+        self.assertEqual(timings.stats(), [
+            {
+                "mixin": "AMixin", "phase": "cleanup", "tests": 1,
+                "total": 2.0, "mean": 2.0, "max": 2.0, "slowest": "test_two",
+            },
+            {
+                "mixin": "AMixin", "phase": "setup", "tests": 2,
+                "total": 1.25, "mean": 0.625, "max": 0.75, "slowest": "test_one",
+            },
+        ])
+        report = timings.report().splitlines()
+        self.assertEqual(len(report), 4)
+        self.assertIn("AMixin.cleanup", report[2])
+        self.assertIn("AMixin.setup", report[3])
+
+    def test_mixins_are_timed(self):
+        class TimedTests(
+            EnvironmentAwareMixin, StdStreamCapturingMixin, TempDirMixin, unittest.TestCase
+        ):
+            def test_one(self):
+                self.make_file("one.txt")
+
+            def test_two(self):
+                self.make_file("two.txt")
+
+        def counts():
+            return dict(
+                ((stat["mixin"], stat["phase"]), stat["tests"]) for stat in mixin_timings()
+            )
+
+        before = counts()
+        results = run_tests_from_class(TimedTests)
+        TempDirMixin._class_behaviors.pop(TimedTests)
+        assert_all_passed(results, tests_run=2)
+        after = counts()
+
+        for mixin in [
+            "EnvironmentAwareMixin", "ModuleAwareMixin", "StdStreamCapturingMixin",
+            "SysPathAwareMixin", "TempDirMixin",
+        ]:
+            for phase in ["setup", "cleanup"]:
+                self.assertEqual(after[(mixin, phase)] - before.get((mixin, phase), 0), 2)
+
+
+def make_forked_tests():
+    """Make a class of tests to run in forked children."""
+
+    class ForkedTests(ForkIsolationMixin, unittest.TestCase):
+        def test_change_globals(self):
+            os.environ["XYZZY_PLUGH"] = "Vogon"
+            sys.path.append("/xyzzy/plugh")
+            sys.modules["xyzzy_plugh"] = sys
+
+        def test_fail(self):
+            self.assertEqual(1, 2)
+
+        def test_error(self):
+            raise ValueError("Boom in {0}".format(os.getpid()))
+
+        def test_skip(self):
+            self.skipTest("Not today")
+
+        def test_pass(self):
+            pass
+
+    return ForkedTests
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork")
+class ForkIsolationMixinTest(unittest.TestCase):
+    """Tests of ForkIsolationMixin and run_forked_tests."""
+
+    def check_results(self, results):
+        """Check the results of running the forked tests."""
+        self.assertEqual(results.testsRun, 5)
+        self.assertEqual(len(results.failures), 1)
+        self.assertEqual(results.failures[0][0]._testMethodName, "test_fail")
+        self.assertIn("AssertionError: 1 != 2", results.failures[0][1])
+        # The child's traceback is reported, and nothing from the parent.
+        self.assertTrue(results.failures[0][1].startswith("AssertionError: Traceback"))
+        self.assertNotIn("_exc_info", results.failures[0][1])
+        self.assertEqual(len(results.errors), 1)
+        self.assertEqual(results.errors[0][0]._testMethodName, "test_error")
+        pid = int(re.search(r"ValueError: Boom in (\d+)", results.errors[0][1]).group(1))
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(len(results.skipped), 1)
+        self.assertEqual(results.skipped[0][1], "Not today")
+
+        self.assertNotIn("XYZZY_PLUGH", os.environ)
+        self.assertNotIn("/xyzzy/plugh", sys.path)
+        self.assertNotIn("xyzzy_plugh", sys.modules)
+
+    def test_forked_tests(self):
+        self.check_results(run_tests_from_class(make_forked_tests()))
+
+    def test_failures_are_reported_with_a_traceback(self):
+        # Some runners, like pytest, need a real traceback object.
+        reported = []
+
+        class RecordingResult(unittest.TestResult):
+            def addFailure(self, test, err):
+                reported.append(err)
+                super(RecordingResult, self).addFailure(test, err)
+
+            def addError(self, test, err):
+                reported.append(err)
+                super(RecordingResult, self).addError(test, err)
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(make_forked_tests())
+        results = RecordingResult()
+        suite.run(results)
+        self.assertEqual(len(reported), 2)
+        for _, _, tb in reported:
+            self.assertIsInstance(tb, types.TracebackType)
+        self.check_results(results)
+
+    def run_forked(self, klass):
+        """Run the tests in `klass` with run_forked_tests, and return the result."""
+        suite = unittest.TestLoader().loadTestsFromTestCase(klass)
+        results = unittest.TestResult()
+        run_forked_tests(suite, results, processes=2)
+        return results
+
+    def test_skipped_class(self):
+        @unittest.skip("Not this class")
+        class SkippedTests(ForkIsolationMixin, unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                raise ValueError("Shouldn't set up a skipped class")
+
+            def test_one(self):
+                pass
+
+        results = self.run_forked(SkippedTests)
+        self.assertEqual(results.errors, [])
+        self.assertEqual([reason for _, reason in results.skipped], ["Not this class"])
+
+    def test_class_and_module_fixtures(self):
+        calls = []
+        module = types.ModuleType("xyzzy_forked_module")
+        module.setUpModule = lambda: calls.append("setUpModule")
+        module.tearDownModule = lambda: calls.append("tearDownModule")
+        sys.modules["xyzzy_forked_module"] = module
+        self.addCleanup(sys.modules.pop, "xyzzy_forked_module")
+
+        class FixtureTests(ForkIsolationMixin, unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                calls.append("setUpClass")
+
+            @classmethod
+            def tearDownClass(cls):
+                calls.append("tearDownClass")
+                raise ValueError("Boom in tearDownClass")
+
+            def test_one(self):
+                pass
+
+        FixtureTests.__module__ = "xyzzy_forked_module"
+        results = self.run_forked(FixtureTests)
+        self.assertEqual(results.testsRun, 1)
+        self.assertEqual(calls, ["setUpModule", "setUpClass", "tearDownClass", "tearDownModule"])
+        self.assertEqual(len(results.errors), 1)
+        self.assertEqual(
+            str(results.errors[0][0]), "tearDownClass (xyzzy_forked_module.FixtureTests)",
+        )
+        self.assertIn("Boom in tearDownClass", results.errors[0][1])
+
+    def test_failed_module_setup(self):
+        module = types.ModuleType("xyzzy_forked_module")
+        module.setUpModule = lambda: 1/0
+        sys.modules["xyzzy_forked_module"] = module
+        self.addCleanup(sys.modules.pop, "xyzzy_forked_module")
+
+        class FixtureTests(ForkIsolationMixin, unittest.TestCase):
+            def test_one(self):
+                pass
+
+        FixtureTests.__module__ = "xyzzy_forked_module"
+        results = self.run_forked(FixtureTests)
+        self.assertEqual(results.testsRun, 0)
+        self.assertEqual(len(results.errors), 1)
+        self.assertEqual(str(results.errors[0][0]), "setUpModule (xyzzy_forked_module)")
+
+    def test_should_stop(self):
+        class FailingTests(ForkIsolationMixin, unittest.TestCase):
+            pass
+
+        for n in range(6):
+            setattr(FailingTests, "test_{0}".format(n), lambda self: self.fail("Nope"))
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(FailingTests)
+        results = unittest.TestResult()
+        results.failfast = True
+        run_forked_tests(suite, results, processes=1)
+        self.assertEqual(results.testsRun, 1)
+        self.assertEqual(len(results.failures), 1)
+
+    def temp_dir_setups(self):
+        """How many TempDirMixin setups have been timed."""
+        for timing in mixin_timings():
+            if (timing["mixin"], timing["phase"]) == ("TempDirMixin", "setup"):
+                return timing["tests"]
+        return 0
+
+    def test_records_for_exit_reports_come_back(self):
+        class _RecordingTests(
+            ForkIsolationMixin, StdStreamCapturingMixin, TempDirMixin, unittest.TestCase
+        ):
+            instrument_capture = True
+
+            def test_one(self):
+                self.make_file("one.txt", "1234")
+                print("Hello")
+
+            def test_two(self):
+                self.make_file("two.txt", "12")
+
+        # Avoid nested class names in the test ids, as in
+        # test_tests_are_in_distinct_temp_dirs.
+        RecordingTests = type("RecordingTests", (_RecordingTests,), {})
+
+        self.addCleanup(mixins._capture_stats.clear)
+        temp_dir_setups = self.temp_dir_setups()
+        old_stdout = sys.stdout
+        sys.stdout = six.StringIO()
+        try:
+            results = self.run_forked(RecordingTests)
+        finally:
+            sys.stdout = old_stdout
+        behavior = TempDirMixin._class_behaviors.pop(RecordingTests)
+        assert_all_passed(results, tests_run=2)
+
+        self.assertEqual(behavior.tests, 2)
+        self.assertEqual(behavior.tests_making_files, 2)
+        self.assertEqual(behavior.files_made, 2)
+        self.assertEqual(behavior.bytes_written, 6)
+
+        self.assertEqual(
+            sorted(mixins._capture_stats), [
+                "tests.test_mixins.RecordingTests.test_one",
+                "tests.test_mixins.RecordingTests.test_two",
+            ],
+        )
+        one = mixins._capture_stats["tests.test_mixins.RecordingTests.test_one"]
+        self.assertEqual(one["stdout"]["writes"], 2)
+
+        self.assertEqual(self.temp_dir_setups(), temp_dir_setups + 2)
+
+    def test_forked_tests_get_their_own_python_workers(self):
+        class RunPythonForkedTests(ForkIsolationMixin, TempDirMixin, unittest.TestCase):
+            def check_run_python(self, n):
+                # Different run times, so results would come back out of order.
+                self.make_file("script.py", """\
+                    import time
+                    time.sleep({0})
+                    print({1})
+                    """.format(0.005 * (n % 4), n))
+                for _ in range(3):
+                    self.assertEqual(self.run_python("script.py"), (0, "{0}\n".format(n), ""))
+
+        for n in range(12):
+            setattr(
+                RunPythonForkedTests, "test_{0}".format(n),
+                lambda self, n=n: self.check_run_python(n),
+            )
+
+        # The parent has a pool of workers before the children are forked.
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        script = make_file(os.path.join(temp_dir, "parent.py"), "print('parent')")
+        self.assertEqual(run_python(script), (0, "parent\n", ""))
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(RunPythonForkedTests)
+        results = unittest.TestResult()
+        run_forked_tests(suite, results, processes=4)
+        assert_all_passed(results, tests_run=12)
+
+    def test_run_forked_tests(self):
+        suite = unittest.TestLoader().loadTestsFromTestCase(make_forked_tests())
+        results = unittest.TestResult()
+        run_forked_tests(suite, results, processes=3)
+        self.check_results(results)
+
+
+class ProfilingMixinTest(EnvironmentAwareMixin, TempDirMixin, unittest.TestCase):
+    """Tests of ProfilingMixin."""
+
+    no_files_in_temp_dir = True
+
+    def test_profiling(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+        profile_dir = os.path.join(self.temp_dir, "profiles")
+
+        class _ProfiledTests(ProfilingMixin, TempDirMixin, unittest.TestCase):
+            profile_tests = "cpu,memory"
+            profile_dir = "profiles"
+
+            def test_one(self):
+                self.make_file("one.txt")
+                self.data = ["x" * 100 for _ in range(1000)]
+
+            def test_two(self):
+                self.make_file("two.txt")
+
+        # Avoid nested class names in the test ids, as in
+        # test_tests_are_in_distinct_temp_dirs.
+        ProfiledTests = type("ProfiledTests", (_ProfiledTests,), {})
+
+        self.del_environ("UNITTEST_MIXINS_PROFILE")
+        results = run_tests_from_class(ProfiledTests)
+        TempDirMixin._class_behaviors.pop(ProfiledTests)
+        assert_all_passed(results, tests_run=2)
+
+        # The profile directory is where we were, not in the tests' temp dirs.
+        files = sorted(os.listdir(profile_dir))
+        expected = [
+            "tests_test_mixins_ProfiledTests_test_one.prof",
+            "tests_test_mixins_ProfiledTests_test_two.prof",
+        ]
+        if tracemalloc is not None:
+            expected += [
+                "tests_test_mixins_ProfiledTests_test_one.memory.txt",
+                "tests_test_mixins_ProfiledTests_test_two.memory.txt",
+            ]
+        self.assertEqual(files, sorted(expected))
+
+        _report_on_profiles()
+        self.assertTrue(os.path.exists(os.path.join(profile_dir, "combined.prof")))
+        if tracemalloc is None:
+            # Memory profiling needs tracemalloc, which Python 2 doesn't have.
+            self.assertFalse(os.path.exists(os.path.join(profile_dir, "memory.txt")))
+            return
+
+        with open(os.path.join(profile_dir, expected[2])) as f:
+            self.assertIn("test_mixins.py", f.read())
+        with open(os.path.join(profile_dir, "memory.txt")) as f:
+            memory = f.read()
+        self.assertIn("tests.test_mixins.ProfiledTests.test_one:\n", memory)
+        self.assertIn("tests.test_mixins.ProfiledTests.test_two:\n", memory)
+
+    def test_not_profiling(self):
+        class UnprofiledTests(ProfilingMixin, unittest.TestCase):
+            def test_one(self):
+                pass
+
+        self.del_environ("UNITTEST_MIXINS_PROFILE")
+        results = run_tests_from_class(UnprofiledTests)
+        assert_all_passed(results, tests_run=1)
+        self.assertFalse(os.path.exists("test_profiles"))
+
+
+@unittest.skipUnless(os.path.isdir("/proc"), "Needs /proc to find leaks")
+class ResourceLeakMixinTest(unittest.TestCase):
+    """Tests of ResourceLeakMixin."""
+
+    def test_no_leaks(self):
+        class TidyTests(ResourceLeakMixin, unittest.TestCase):
+            def test_file(self):
+                with open(__file__) as f:
+                    f.read()
+
+            def test_thread(self):
+                thread = threading.Thread(target=lambda: None)
+                thread.start()
+                thread.join()
+
+            def test_child(self):
+                subprocess.call([sys.executable, "-c", "pass"])
+
+        results = run_tests_from_class(TidyTests)
+        assert_all_passed(results, tests_run=3)
+
+    def test_leaks(self):
+        stop = threading.Event()
+        leaked = {}
+
+        class LeakyTests(ResourceLeakMixin, unittest.TestCase):
+            def test_file(self):
+                leaked["fd"] = os.open(__file__, os.O_RDONLY)
+
+            def test_thread(self):
+                thread = threading.Thread(target=stop.wait, name="Leaky")
+                thread.start()
+
+            def test_child(self):
+                leaked["pid"] = os.fork()
+                if leaked["pid"] == 0:
+                    os._exit(0)
+
+        try:
+            results = run_tests_from_class(LeakyTests)
+        finally:
+            stop.set()
+            if "fd" in leaked:
+                os.close(leaked["fd"])
+            if "pid" in leaked:
+                os.waitpid(leaked["pid"], 0)
+
+        self.assertEqual(results.testsRun, 3)
+        failures = cleanup_failures(results)
+        self.assertEqual(sorted(failures), ["test_child", "test_file", "test_thread"])
+        six.assertRegex(
+            self, failures["test_file"],
+            r"leaked resources:\n    file descriptor {0}: .*test_mixins.py".format(leaked["fd"]),
+        )
+        self.assertIn("    thread 'Leaky'\n", failures["test_thread"])
+        self.assertIn(
+            "    child process {0} (zombie)\n".format(leaked["pid"]), failures["test_child"],
+        )
+
+    def test_listed_children(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        make_file(os.path.join(temp_dir, "100", "children"), "123 456 ")
+        make_file(os.path.join(temp_dir, "101", "children"), "")
+        make_file(os.path.join(temp_dir, "102", "children"), "789")
+        self.assertEqual(sorted(mixins._listed_children(temp_dir)), [123, 456, 789])
+
+        # Without the children files, we can't tell.
+        os.remove(os.path.join(temp_dir, "101", "children"))
+        self.assertIsNone(mixins._listed_children(temp_dir))
+
+    def test_reaping_and_warning(self):
+        leaked = {}
+
+        class ReapedTests(ResourceLeakMixin, unittest.TestCase):
+            leak_check = "warn"
+            reap_leaks = True
+
+            def test_leaks(self):
+                leaked["fd"] = os.open(__file__, os.O_RDONLY)
+                leaked["child"] = subprocess.Popen(
+                    [sys.executable, "-c", "import time; time.sleep(60)"],
+                )
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            results = run_tests_from_class(ReapedTests)
+        assert_all_passed(results, tests_run=1)
+
+        self.assertEqual(len(caught), 1)
+        message = str(caught[0].message)
+        self.assertIn("file descriptor {0}: ".format(leaked["fd"]), message)
+        self.assertIn("child process {0}\n".format(leaked["child"].pid), message)
+
+        # The fd was closed, and the child was stopped and reaped.
+        with self.assertRaises(OSError):
+            os.fstat(leaked["fd"])
+        with self.assertRaises(OSError):
+            os.kill(leaked["child"].pid, 0)
+        # Keep Popen from complaining that the child is still running.
+        leaked["child"].returncode = -1
+
+
+class PerformanceBudgetMixinTest(
+    EnvironmentAwareMixin, StdStreamCapturingMixin, TempDirMixin, unittest.TestCase
+):
+    """Tests of PerformanceBudgetMixin."""
+
+    def run_budgeted_tests(self):
+        """Run some budgeted tests, and return the report printed at exit."""
+        class _BudgetedTests(PerformanceBudgetMixin, TempDirMixin, unittest.TestCase):
+            performance_budgets = os.path.join(self.temp_dir, "budgets.json")
+
+            def test_slow(self):
+                self.make_file("slow.txt")
+                time.sleep(0.05)
+
+            def test_big(self):
+                self.make_file("big.txt", "x" * 5000)
+
+        # Avoid nested class names in the test ids, as in
+        # test_tests_are_in_distinct_temp_dirs.
+        BudgetedTests = type("BudgetedTests", (_BudgetedTests,), {})
+
+        results = run_tests_from_class(BudgetedTests)
+        TempDirMixin._class_behaviors.pop(BudgetedTests)
+        assert_all_passed(results, tests_run=2)
+
+        start = len(self.stdout())
+        _report_on_budgets()
+        return self.stdout()[start:]
+
+    def test_over_budget(self):
+        self.del_environ("UNITTEST_MIXINS_BUDGETS")
+        self.del_environ("UNITTEST_MIXINS_BUDGET_BASELINE")
+        self.make_file("budgets.json", """\
+            {
+                "tolerance": 0.5,
+                "default": {"wall_time": 1.0, "temp_dir_bytes": 1000},
+                "classes": {
+                    "tests.test_mixins.BudgetedTests": {"wall_time": 0.01}
+                },
+                "tests": {
+                    "tests.test_mixins.BudgetedTests.test_big": {"wall_time": 1.0}
+                }
+            }
+            """)
+        report = self.run_budgeted_tests()
+        lines = sorted(report.splitlines())
+        self.assertEqual(len(lines), 2)
+        six.assertRegex(
+            self, lines[0],
+            r"^Over budget: tests.test_mixins.BudgetedTests.test_big: "
+            r"temp_dir_bytes was 5000, over the budget of 1000$",
+        )
+        match = re.match(
+            r"^Over budget: tests.test_mixins.BudgetedTests.test_slow: "
+            r"wall_time was ([\d.e+-]+), over the budget of 0.01$",
+            lines[1],
+        )
+        self.assertIsNotNone(match, lines[1])
+        self.assertGreaterEqual(float(match.group(1)), 0.05)
+
+    def test_writing_a_baseline(self):
+        self.set_environ("UNITTEST_MIXINS_BUDGET_BASELINE", "baseline.json")
+        self.del_environ("UNITTEST_MIXINS_BUDGETS")
+        self.make_file("budgets.json", "{}")
+        self.make_file("baseline.json", '{"tolerance": 2.0, "tests": {"x.y.z": {}}}')
+        report = self.run_budgeted_tests()
+        self.assertEqual(report, "")
+
+        with open("baseline.json") as f:
+            baseline = json.load(f)
+        self.assertEqual(baseline["tolerance"], 2.0)
+        self.assertEqual(
+            sorted(baseline["tests"]), [
+                "tests.test_mixins.BudgetedTests.test_big",
+                "tests.test_mixins.BudgetedTests.test_slow",
+                "x.y.z",
+            ],
+        )
+        big = baseline["tests"]["tests.test_mixins.BudgetedTests.test_big"]
+        self.assertEqual(big["temp_dir_bytes"], 5000)
+        self.assertGreater(
+            baseline["tests"]["tests.test_mixins.BudgetedTests.test_slow"]["wall_time"], 0.05,
+        )
+
+        # The baseline works as a budget configuration, relative to where the
+        # tests start.  Only the temp dir sizes are kept, since the times and
+        # memory of a second run can vary too much.
+        for budget in baseline["tests"].values():
+            for name in list(budget):
+                if name != "temp_dir_bytes":
+                    del budget[name]
+        big["temp_dir_bytes"] = 1000
+        with open("baseline.json", "w") as f:
+            json.dump(baseline, f)
+        self.set_environ("UNITTEST_MIXINS_BUDGETS", "baseline.json")
+        self.del_environ("UNITTEST_MIXINS_BUDGET_BASELINE")
+        self.assertEqual(
+            self.run_budgeted_tests(),
+            "Over budget: tests.test_mixins.BudgetedTests.test_big: "
+            "temp_dir_bytes was 5000, over the budget of 1000\n",
+        )
+
+    def test_missing_budgets_file(self):
+        class MissingBudgetTests(PerformanceBudgetMixin, unittest.TestCase):
+            performance_budgets = "no_such_budgets.json"
+
+            def test_nothing(self):
+                pass
+
+        self.del_environ("UNITTEST_MIXINS_BUDGETS")
+        results = run_tests_from_class(MissingBudgetTests)
+        self.assertEqual(len(results.errors), 1)
+        self.assertIn("no_such_budgets.json", results.errors[0][1])
@@ -1,15 +1,67 @@
 # Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
 # For details: https://github.com/nedbat/unittest-mixins/blob/master/NOTICE.txt
 
-from .mixins import (       # noqa
-    change_dir,
-    make_file,
-    saved_sys_path,
-    ModuleAwareMixin,
-    ModuleCleaner,
-    SysPathAwareMixin,
-    EnvironmentAwareMixin,
-    StdStreamCapturingMixin,
-    DelayedAssertionMixin,
-    TempDirMixin,
-)
+"""Helpful mixins for unittest classes.
+
+The names here are loaded from .mixins when first used, so that importing
+this package is quick.
+
+"""
+
+import sys
+
+__all__ = [
+    "change_dir",
+    "make_file",
+    "make_tree",
+    "mixin_timings",
+    "run_forked_tests",
+    "run_python",
+    "saved_sys_path",
+    "ModuleAwareMixin",
+    "ModuleCleaner",
+    "SysPathAwareMixin",
+    "EnvironmentAwareMixin",
+    "ClassModuleAwareMixin",
+    "ClassSysPathAwareMixin",
+    "ClassEnvironmentAwareMixin",
+    "StdStreamCapturingMixin",
+    "DelayedAssertionMixin",
+    "ForkIsolationMixin",
+    "ForkedTestError",
+    "PerformanceBudgetMixin",
+    "ProfilingMixin",
+    "ResourceLeakMixin",
+    "TempDirMixin",
+]
+
+
+def _mixins():
+    """Import and return the .mixins module."""
+    # Not "from . import mixins", which would ask our __getattr__ for it.
+    name = __name__ + ".mixins"
+    __import__(name)
+    return sys.modules[name]
+
+
+def _load(name):
+    """Get `name` from .mixins, and keep it here for next time."""
+    value = getattr(_mixins(), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in __all__:
+            return _load(name)
+        if name == "mixins":
+            return _mixins()
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()) | set(__all__))
+else:
+    # Modules can't have __getattr__, so load everything now.
+    for _name in __all__:
+        _load(_name)
@@ -0,0 +1,23 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/nedbat/unittest-mixins/blob/master/NOTICE.txt
+
+"""Helpers whose frames are left out of the tracebacks unittest reports."""
+
+import sys
+
+# unittest skips the frames of modules with this global.
+__unittest = True
+
+
+def exc_info(exc):
+    """Get an exc_info tuple for the exception `exc`, by raising it here.
+
+    The traceback is real, but only has a frame from this module, which
+    unittest and pytest leave out of their reports.
+
+    """
+    __tracebackhide__ = True
+    try:
+        raise exc
+    except BaseException:
+        return sys.exc_info()
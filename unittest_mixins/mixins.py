@@ -3,22 +3,45 @@
 
 """Mixin classes to help make good tests."""
 
+# Only modules that unittest imports anyway are imported here.  Others are
+# imported where they are used, so that importing us is quick.
 import atexit
 import collections
 import contextlib
+import difflib
+import functools
+import inspect
+import io
 import os
-import random
 import re
-import shutil
 import sys
-import tempfile
 import textwrap
+import time
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
-import six
+PY3 = sys.version_info >= (3, 0)
+
+# The types of strings, like six.string_types.
+_string_types = (str, type(u""))
+
+
+# The functions registered to run at exit.
+_at_exit_functions = set()
+
+
+def _register_at_exit(function):
+    """Register `function` to run at process exit, if it isn't already.
+
+    Exit functions are only registered when they are first needed, so that
+    merely importing us does nothing at exit.
+
+    """
+    if function not in _at_exit_functions:
+        _at_exit_functions.add(function)
+        atexit.register(function)
 
 
 class _Tee(object):
@@ -29,6 +52,8 @@ class _Tee(object):
         self._files = files
         if hasattr(files[0], "encoding"):
             self.encoding = files[0].encoding
+        # The binary layer, like sys.stdout.buffer.
+        self.buffer = _BufferTee(*files)
 
     def write(self, data):
         """Write `data` to all the files."""
@@ -51,6 +76,194 @@ class _Tee(object):
             return getattr(self._files[0], name)
 
 
+class _BufferTee(object):
+    """The binary layer of a `_Tee`, writing bytes to all of its files.
+
+    Files with a binary layer of their own get the bytes.  Files without one
+    get the bytes decoded to text.
+
+    """
+
+    def __init__(self, *files):
+        self._files = []
+        for f in files:
+            buffer = getattr(f, "buffer", None)
+            if buffer is None:
+                buffer = _DecodingWriter(f, getattr(f, "encoding", None) or "utf-8")
+            self._files.append(buffer)
+
+    def write(self, data):
+        """Write the bytes `data` to all the files."""
+        for f in self._files:
+            f.write(data)
+        return len(data)
+
+    def flush(self):
+        """Flush the data on all the files."""
+        for f in self._files:
+            f.flush()
+
+    def getvalue(self):
+        """The bytes written to the first file, if it can tell us."""
+        return self._files[0].getvalue()
+
+
+class _DecodingWriter(object):
+    """A binary file-like that writes decoded text to a text file-like."""
+
+    def __init__(self, text_file, encoding):
+        import codecs
+        self._file = text_file
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    def write(self, data):
+        """Decode the bytes `data`, and write the text."""
+        text = self._decoder.decode(bytes(data))
+        if text:
+            self._file.write(text)
+        return len(data)
+
+    def flush(self):
+        """Flush the text file."""
+        self._file.flush()
+
+
+class _CaptureStream(io.TextIOBase):
+    """A text stream that captures what's written to it as bytes.
+
+    Text is stored encoded, in the same buffer as bytes written to `.buffer`,
+    so binary data is kept as-is and in order with the text.  The text view
+    from `getvalue` is decoded only when asked for, and only the bytes
+    written since the last time are decoded.
+
+    Like StringIO, it can be truncated and written over after seeking.  As
+    with other text streams, positions are byte offsets.  It has no file
+    descriptor: `fileno` raises io.UnsupportedOperation.
+
+    """
+
+    encoding = "utf-8"
+    errors = "surrogateescape" if PY3 else "replace"
+
+    def __init__(self):
+        super(_CaptureStream, self).__init__()
+        self._data = bytearray()
+        self._pos = 0
+        # On Python 2, whether we've been given unicode text.
+        self._wrote_unicode = False
+        self.buffer = _CaptureBuffer(self)
+        self._forget_decoded()
+
+    def _forget_decoded(self):
+        """Start decoding the text view from the beginning again."""
+        import codecs
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+        self._decoded = []
+        self._decoded_length = 0
+
+    def _write_bytes(self, data):
+        """Write the bytes `data` at the current position."""
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        end = len(self._data)
+        if self._pos == end:
+            self._data += data
+        else:
+            if self._pos > end:
+                # Like StringIO, writing past the end pads with nulls.
+                self._data += b"\0" * (self._pos - end)
+            self._data[self._pos:self._pos + len(data)] = data
+            if self._pos < self._decoded_length:
+                self._forget_decoded()
+        self._pos += len(data)
+
+    def write(self, text):
+        """Write `text`, a string."""
+        if not isinstance(text, _string_types):
+            raise TypeError(
+                "write() argument must be str, not {0}".format(type(text).__name__)
+            )
+        if isinstance(text, bytes):
+            # Only on Python 2: str is bytes.
+            self._write_bytes(text)
+        else:
+            self._wrote_unicode = True
+            self._write_bytes(text.encode(self.encoding, self.errors))
+        return len(text)
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        """Move to `offset` from the start, or to the current position or end.
+
+        As with other text streams, `offset` must be 0 unless `whence` is 0.
+
+        """
+        if whence == 0:
+            if offset < 0:
+                raise ValueError("Negative seek position {0}".format(offset))
+            self._pos = offset
+        elif whence in (1, 2) and offset == 0:
+            if whence == 2:
+                self._pos = len(self._data)
+        else:
+            raise io.UnsupportedOperation("can't do nonzero cur-relative or end-relative seeks")
+        return self._pos
+
+    def truncate(self, size=None):
+        """Cut the data off at `size`, or the current position."""
+        if size is None:
+            size = self._pos
+        del self._data[size:]
+        if size < self._decoded_length:
+            self._forget_decoded()
+        return size
+
+    def getvalue(self):
+        """The text written so far.
+
+        On Python 2, this is a native (byte) string, unless unicode was
+        written, as with StringIO.StringIO.  Then it's unicode, with any bytes
+        that aren't UTF-8 replaced.
+
+        """
+        if not PY3 and not self._wrote_unicode:
+            return bytes(self._data)
+        if self._decoded_length < len(self._data):
+            new = self._data[self._decoded_length:]
+            self._decoded_length = len(self._data)
+            self._decoded.append(self._decoder.decode(bytes(new)))
+            if len(self._decoded) > 1:
+                self._decoded = ["".join(self._decoded)]
+        return self._decoded[0] if self._decoded else ""
+
+
+class _CaptureBuffer(object):
+    """The binary layer of a `_CaptureStream`."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, data):
+        """Write the bytes `data`."""
+        self._stream._write_bytes(data)
+        return len(data)
+
+    def flush(self):
+        """Nothing to flush."""
+
+    def getvalue(self):
+        """All the bytes written so far, text and binary."""
+        return bytes(self._stream._data)
+
+
 @contextlib.contextmanager
 def change_dir(new_dir):
     """Change directory, and then change back.
@@ -101,191 +314,2075 @@ def setup_with_context_manager(testcase, cm):
     return val
 
 
+# The most precise clock we have, for timing things.
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class _MixinTimings(object):
+    """Accumulate how long each mixin's setUp and cleanup took.
+
+    Times are collected per test: one test's several cleanups for a mixin add
+    up to a single time for that test.
+
+    """
+
+    def __init__(self):
+        # Map from (mixin, phase) to a dict of numbers.
+        self._stats = {}
+
+    def add(self, mixin, phase, test_id, seconds):
+        """Record that `mixin` took `seconds` for `phase` of `test_id`."""
+        stat = self._stats.get((mixin, phase))
+        if stat is None:
+            stat = self._stats[(mixin, phase)] = {
+                "tests": 0, "total": 0.0, "max": 0.0, "slowest": None,
+                "test": None, "current": 0.0,
+            }
+        if stat["test"] != test_id:
+            self._finish_test(stat)
+            stat["tests"] += 1
+            stat["test"] = test_id
+            stat["current"] = 0.0
+        stat["current"] += seconds
+        stat["total"] += seconds
+
+    def _finish_test(self, stat):
+        """Fold the time of the latest test into the maximum."""
+        if stat["test"] is not None and stat["current"] > stat["max"]:
+            stat["max"] = stat["current"]
+            stat["slowest"] = stat["test"]
+
+    def stats(self):
+        """Get the timings so far, as a list of dicts, slowest total first."""
+        stats = []
+        for (mixin, phase), stat in self._stats.items():
+            self._finish_test(stat)
+            stats.append({
+                "mixin": mixin,
+                "phase": phase,
+                "tests": stat["tests"],
+                "total": stat["total"],
+                "mean": stat["total"] / stat["tests"],
+                "max": stat["max"],
+                "slowest": stat["slowest"],
+            })
+        stats.sort(key=lambda stat: stat["total"], reverse=True)
+        return stats
+
+    def reset(self):
+        """Forget all of the timings."""
+        self._stats.clear()
+
+    def raw(self):
+        """Get the timings as they are kept, to `merge` into another _MixinTimings."""
+        for stat in self._stats.values():
+            self._finish_test(stat)
+        return dict(self._stats)
+
+    def merge(self, raw):
+        """Add in the timings from another _MixinTimings's `raw`."""
+        for key, other in raw.items():
+            stat = self._stats.get(key)
+            if stat is None:
+                self._stats[key] = dict(other)
+                continue
+            self._finish_test(stat)
+            stat["tests"] += other["tests"]
+            stat["total"] += other["total"]
+            if other["max"] > stat["max"]:
+                stat["max"] = other["max"]
+                stat["slowest"] = other["slowest"]
+            stat["test"] = None
+            stat["current"] = 0.0
+
+    def report(self):
+        """Produce a text report of the timings."""
+        lines = [
+            "Mixin setUp and cleanup times, slowest first:",
+            "{0:>10} {1:>7} {2:>10} {3:>10}  {4:<40} {5}".format(
+                "total(s)", "tests", "mean(ms)", "max(ms)", "mixin", "slowest test",
+            ),
+        ]
+        for stat in self.stats():
+            lines.append("{0:10.3f} {1:7d} {2:10.3f} {3:10.3f}  {4:<40} {5}".format(
+                stat["total"], stat["tests"], stat["mean"] * 1000, stat["max"] * 1000,
+                "{0}.{1}".format(stat["mixin"], stat["phase"]), stat["slowest"],
+            ))
+        return "\n".join(lines) + "\n"
+
+
+_mixin_timings = _MixinTimings()
+
+
+def mixin_timings():
+    """Get the setUp and cleanup times of the mixins, in this process.
+
+    Returns a list of dicts, one for each mixin and phase ("setup" or
+    "cleanup"), with the slowest total first.  Each dict has keys "mixin",
+    "phase", "tests" (how many tests were timed), "total", "mean", and "max"
+    (in seconds), and "slowest" (the id of the slowest test).
+
+    """
+    return _mixin_timings.stats()
+
+
+@contextlib.contextmanager
+def _timing(testcase, mixin, phase):
+    """Time the with-statement as `phase` of `mixin` for `testcase`.
+
+    `testcase` can also be a test class, for class-level setup and cleanup.
+
+    """
+    _register_at_exit(_report_on_mixin_timings)
+    if isinstance(testcase, type):
+        test_id = "{0}.{1}".format(testcase.__module__, testcase.__name__)
+    else:
+        test_id = testcase.id()
+    start = _clock()
+    try:
+        yield
+    finally:
+        _mixin_timings.add(mixin, phase, test_id, _clock() - start)
+
+
+def _add_timed_cleanup(testcase, mixin, function, *args):
+    """Like `testcase.addCleanup`, but time the cleanup for `mixin`."""
+    def timed_cleanup():
+        with _timing(testcase, mixin, "cleanup"):
+            function(*args)
+    testcase.addCleanup(timed_cleanup)
+
+
+def _report_on_mixin_timings():
+    """Called at process exit to report the mixin timings, if asked to.
+
+    Set the environment variable UNITTEST_MIXINS_TIMINGS to a file name to
+    get a report: JSON if the name ends with ".json", text otherwise.  Use
+    "-" to write the text report to stdout.
+
+    """
+    destination = os.environ.get("UNITTEST_MIXINS_TIMINGS")
+    if not destination:
+        return
+    import json
+    if destination == "-":
+        sys.stdout.write(_mixin_timings.report())
+    elif destination.endswith(".json"):
+        with open(destination, "w") as f:
+            json.dump(_mixin_timings.stats(), f, indent=4)
+    else:
+        with open(destination, "w") as f:
+            f.write(_mixin_timings.report())
+
+
 class ModuleCleaner(object):
     """Remember the state of sys.modules, and provide a way to restore it."""
 
     def __init__(self):
-        self._old_modules = list(sys.modules)
+        self._old_modules = set(sys.modules)
+
+    def cleanup_modules(self):
+        """Remove any new modules imported since our construction.
+
+        This lets us import the same source files for more than one test, or
+        if called explicitly, within one test.
+
+        """
+        for m in [m for m in sys.modules if m not in self._old_modules]:
+            del sys.modules[m]
+
+    def modules_added(self):
+        """Might modules have been imported since our construction?
+
+        This only compares the number of modules, so it's quick, but is
+        fooled if modules were also removed.
+
+        """
+        return len(sys.modules) != len(self._old_modules)
+
+
+class ModuleAwareMixin(unittest.TestCase):
+    """A test case mixin that isolates changes to sys.modules."""
+
+    def setUp(self):
+        super(ModuleAwareMixin, self).setUp()
+
+        with _timing(self, "ModuleAwareMixin", "setup"):
+            self._module_cleaner = ModuleCleaner()
+            _add_timed_cleanup(self, "ModuleAwareMixin", self._module_cleaner.cleanup_modules)
+
+    def cleanup_modules(self):
+        self._module_cleaner.cleanup_modules()
+
+
+class SysPathAwareMixin(unittest.TestCase):
+    """A test case mixin that isolates changes to sys.path."""
+
+    def setUp(self):
+        super(SysPathAwareMixin, self).setUp()
+
+        with _timing(self, "SysPathAwareMixin", "setup"):
+            cm = saved_sys_path()
+            cm.__enter__()
+            _add_timed_cleanup(self, "SysPathAwareMixin", cm.__exit__, None, None, None)
+
+
+def _apply_environ(values):
+    """Give environment variables the values in `values`.
+
+    `values` maps names to values, or to None for variables that should not
+    exist.  Only variables that differ are changed, so that we don't call
+    putenv needlessly.
+
+    """
+    for name, value in values.items():
+        current = os.environ.get(name)
+        if current == value:
+            continue
+        if value is None:
+            del os.environ[name]
+        else:
+            os.environ[name] = value
+
+
+def _restore_environ_snapshot(snapshot):
+    """Make the environment exactly the `snapshot` dict again."""
+    for name in [name for name in os.environ if name not in snapshot]:
+        del os.environ[name]
+    _apply_environ(snapshot)
+
+
+class EnvironmentAwareMixin(unittest.TestCase):
+    """A test case mixin that isolates changes to the environment.
+
+    Changes made with `set_environ`, `del_environ`, `update_environ`, and
+    `patched_environ` are undone when the test is done.
+
+    If `snapshot_environ` is True, the entire environment is saved before the
+    test, and restored afterward, so that changes made any other way (for
+    example, by the code under test) are also undone.
+
+    """
+
+    # Set this to True to restore the entire environment after each test.
+    snapshot_environ = False
+
+    def setUp(self):
+        super(EnvironmentAwareMixin, self).setUp()
+
+        with _timing(self, "EnvironmentAwareMixin", "setup"):
+            # Record environment variables that we changed with set_environ.
+            self._environ_undos = {}
+
+            if self.snapshot_environ:
+                self._environ_snapshot = dict(os.environ)
+            else:
+                self._environ_snapshot = None
+
+            _add_timed_cleanup(self, "EnvironmentAwareMixin", self._cleanup_environ)
+
+    def set_environ(self, name, value):
+        """Set an environment variable `name` to be `value`.
+
+        The environment variable is set, and record is kept that it was set,
+        so that `cleanup_environ` can restore its original value.
+
+        """
+        if name not in self._environ_undos:
+            self._environ_undos[name] = os.environ.get(name)
+        os.environ[name] = value
+
+    def del_environ(self, name):
+        """Delete an environment variable, unless we set it.
+
+        The environment variable is deleted, unless it had been set by an
+        earlier call to `set_environ` in the same test method.  This can be
+        used to isolate your test from environment variables leaking into your
+        tests, while still allowing your test to affect the particular
+        variables it needs to.
+
+        Attempting to delete a variable that doesn't exist is fine, it does not
+        raise an exception.
+
+        """
+        if name not in self._environ_undos and name in os.environ:
+            self._environ_undos[name] = os.environ.get(name)
+            del os.environ[name]
+
+    def update_environ(self, values):
+        """Set a number of environment variables at once.
+
+        `values` is a dict mapping names to values.  A value of None deletes
+        the variable.  The original values are restored when the test is done.
+
+        """
+        for name, value in values.items():
+            if name not in self._environ_undos:
+                self._environ_undos[name] = os.environ.get(name)
+        _apply_environ(values)
+
+    @contextlib.contextmanager
+    def patched_environ(self, values):
+        """A context manager to set environment variables for a while.
+
+        `values` is a dict as for `update_environ`.  At the end of the
+        with-statement, the variables are restored to their values from before
+        it.
+
+        """
+        saved = dict((name, os.environ.get(name)) for name in values)
+        _apply_environ(values)
+        try:
+            yield
+        finally:
+            _apply_environ(saved)
+
+    def _cleanup_environ(self):
+        """Undo all the changes made to the environment."""
+        if self._environ_snapshot is not None:
+            _restore_environ_snapshot(self._environ_snapshot)
+        else:
+            _apply_environ(self._environ_undos)
+
+
+# The class-scoped mixins below save state once for a whole test class, in
+# setUpClass, and restore it in tearDownClass.  That's much cheaper than doing
+# it for every test, but a test can see changes made by the tests before it.
+# Set `verify_class_snapshot` to True to check after each test whether it
+# changed the state, and restore it right away if it did.
+
+class ClassModuleAwareMixin(unittest.TestCase):
+    """A test case mixin that isolates a test class's changes to sys.modules.
+
+    Like ModuleAwareMixin, but new modules are removed when the class is
+    done, not after each test.  The per-test check only notices a change in
+    the number of modules.
+
+    """
+
+    # Set this to check after each test for new modules, and remove them.
+    verify_class_snapshot = False
+
+    @classmethod
+    def setUpClass(cls):
+        super(ClassModuleAwareMixin, cls).setUpClass()
+        with _timing(cls, "ClassModuleAwareMixin", "setup"):
+            cls._class_module_cleaner = ModuleCleaner()
+
+    @classmethod
+    def tearDownClass(cls):
+        with _timing(cls, "ClassModuleAwareMixin", "cleanup"):
+            cls._class_module_cleaner.cleanup_modules()
+        super(ClassModuleAwareMixin, cls).tearDownClass()
+
+    def setUp(self):
+        super(ClassModuleAwareMixin, self).setUp()
+        if self.verify_class_snapshot:
+            _add_timed_cleanup(self, "ClassModuleAwareMixin", self._verify_modules)
+
+    def _verify_modules(self):
+        """Remove new modules, if there seem to be any."""
+        if self._class_module_cleaner.modules_added():
+            self._class_module_cleaner.cleanup_modules()
+
+    def cleanup_modules(self):
+        self._class_module_cleaner.cleanup_modules()
+
+
+class ClassSysPathAwareMixin(unittest.TestCase):
+    """A test case mixin that isolates a test class's changes to sys.path.
+
+    Like SysPathAwareMixin, but sys.path is restored when the class is done,
+    not after each test.
+
+    """
+
+    # Set this to check sys.path after each test, and restore it if changed.
+    verify_class_snapshot = False
+
+    @classmethod
+    def setUpClass(cls):
+        super(ClassSysPathAwareMixin, cls).setUpClass()
+        with _timing(cls, "ClassSysPathAwareMixin", "setup"):
+            cls._class_sys_path = sys.path[:]
+
+    @classmethod
+    def tearDownClass(cls):
+        with _timing(cls, "ClassSysPathAwareMixin", "cleanup"):
+            sys.path = cls._class_sys_path[:]
+        super(ClassSysPathAwareMixin, cls).tearDownClass()
+
+    def setUp(self):
+        super(ClassSysPathAwareMixin, self).setUp()
+        if self.verify_class_snapshot:
+            _add_timed_cleanup(self, "ClassSysPathAwareMixin", self._verify_sys_path)
+
+    def _verify_sys_path(self):
+        """Restore sys.path, if it changed."""
+        if sys.path != self._class_sys_path:
+            sys.path = self._class_sys_path[:]
+
+
+class ClassEnvironmentAwareMixin(EnvironmentAwareMixin):
+    """A test case mixin that isolates a test class's changes to the environment.
+
+    The entire environment is saved before the class's tests run, and
+    restored afterward.  Changes made with `set_environ` and the other
+    EnvironmentAwareMixin methods are still undone after each test.
+
+    """
+
+    # Set this to check the environment after each test, and restore it if
+    # changed.
+    verify_class_snapshot = False
+
+    @classmethod
+    def setUpClass(cls):
+        super(ClassEnvironmentAwareMixin, cls).setUpClass()
+        with _timing(cls, "ClassEnvironmentAwareMixin", "setup"):
+            cls._class_environ = dict(os.environ)
+
+    @classmethod
+    def tearDownClass(cls):
+        with _timing(cls, "ClassEnvironmentAwareMixin", "cleanup"):
+            _restore_environ_snapshot(cls._class_environ)
+        super(ClassEnvironmentAwareMixin, cls).tearDownClass()
+
+    def setUp(self):
+        super(ClassEnvironmentAwareMixin, self).setUp()
+        if self.verify_class_snapshot:
+            _add_timed_cleanup(self, "ClassEnvironmentAwareMixin", self._verify_environ)
+
+    def _verify_environ(self):
+        """Restore the environment, if it changed."""
+        # This only changes variables that differ, so it's cheap when nothing
+        # did.
+        _restore_environ_snapshot(self._class_environ)
+
+
+# Per-test statistics about writes to captured streams, when capture is
+# instrumented: test id -> stream name -> stats dict.
+_capture_stats = {}
+
+
+def _new_capture_stats():
+    """A fresh dict of statistics for one stream in one test."""
+    return {
+        "writes": 0, "bytes": 0, "total_time": 0.0, "capture_time": 0.0, "terminal_time": 0.0,
+    }
+
+
+def _instrumented_write(files, names, stats, data):
+    """Write `data` to `files`, updating `stats`.
+
+    `names` are the files' roles, "capture" or "terminal", and say which of
+    the stats get the time spent writing to each.
+
+    """
+    start = _clock()
+    for f, name in zip(files, names):
+        file_start = _clock()
+        f.write(data)
+        stats[name + "_time"] += _clock() - file_start
+    stats["writes"] += 1
+    if not isinstance(data, bytes):
+        # Count text as the bytes it becomes in the captured stream.
+        data = data.encode(_CaptureStream.encoding, _CaptureStream.errors)
+    stats["bytes"] += len(data)
+    stats["total_time"] += _clock() - start
+
+
+class _InstrumentedTee(_Tee):
+    """A `_Tee` that counts its writes, and times each of its files."""
+
+    def __init__(self, files, names, stats):
+        super(_InstrumentedTee, self).__init__(*files)
+        self._names = names
+        self._stats = stats
+        self.buffer = _InstrumentedBufferTee(self.buffer, names, stats)
+
+    def write(self, data):
+        """Write `data` to all the files, and count it."""
+        _instrumented_write(self._files, self._names, self._stats, data)
+
+
+class _InstrumentedCaptureStream(_CaptureStream):
+    """A `_CaptureStream` that counts its writes, and times them."""
+
+    def __init__(self, stats):
+        super(_InstrumentedCaptureStream, self).__init__()
+        self._stats = stats
+
+    def _write_bytes(self, data):
+        """Write the bytes `data`, and count it as captured."""
+        start = _clock()
+        super(_InstrumentedCaptureStream, self)._write_bytes(data)
+        elapsed = _clock() - start
+        self._stats["capture_time"] += elapsed
+        self._stats["total_time"] += elapsed
+        self._stats["writes"] += 1
+        self._stats["bytes"] += len(data)
+
+
+class _InstrumentedBufferTee(object):
+    """The binary layer of an `_InstrumentedTee`."""
+
+    def __init__(self, buffer_tee, names, stats):
+        self._buffer_tee = buffer_tee
+        self._names = names
+        self._stats = stats
+
+    def write(self, data):
+        """Write the bytes `data` to all the files, and count it."""
+        _instrumented_write(self._buffer_tee._files, self._names, self._stats, data)
+        return len(data)
+
+    def flush(self):
+        """Flush the data on all the files."""
+        self._buffer_tee.flush()
+
+    def getvalue(self):
+        """The bytes written to the first file, if it can tell us."""
+        return self._buffer_tee.getvalue()
+
+
+def _capture_stats_report():
+    """Produce a text report of the capture statistics, most time first."""
+    header = "{0:>10} {1:>10} {2:>10} {3:>10} {4:>10}  {5:<7} {6}"
+    row = "{0:10d} {1:10d} {2:10.4f} {3:10.4f} {4:10.4f}  {5:<7} {6}"
+    lines = [
+        "Captured output, most time first:",
+        header.format("writes", "bytes", "total(s)", "capture(s)", "terminal(s)", "stream", "test"),
+    ]
+    rows = []
+    totals = {}
+    for test_id, streams in _capture_stats.items():
+        for stream, stats in streams.items():
+            total = totals.setdefault(stream, _new_capture_stats())
+            for key in total:
+                total[key] += stats[key]
+            if stats["writes"]:
+                rows.append((stats["total_time"], test_id, stream, stats))
+    rows.sort(key=lambda r: r[0], reverse=True)
+    for _, test_id, stream, stats in rows:
+        lines.append(row.format(
+            stats["writes"], stats["bytes"], stats["total_time"], stats["capture_time"],
+            stats["terminal_time"], stream, test_id,
+        ))
+    for stream in ["stdout", "stderr"]:
+        total = totals.get(stream)
+        if total is None:
+            continue
+        lines.append(row.format(
+            total["writes"], total["bytes"], total["total_time"], total["capture_time"],
+            total["terminal_time"], stream, "TOTAL",
+        ))
+    return "\n".join(lines) + "\n"
+
+
+def _report_on_capture_stats():
+    """Called at process exit to report on instrumented capture.
+
+    The report goes to the file named by the UNITTEST_MIXINS_CAPTURE_STATS
+    environment variable: JSON if the name ends with ".json", text otherwise.
+    If it isn't set, or is "-", the text report is written to stdout.
+
+    """
+    if not _capture_stats:
+        return
+    destination = os.environ.get("UNITTEST_MIXINS_CAPTURE_STATS") or "-"
+    if destination == "-":
+        sys.stdout.write(_capture_stats_report())
+    elif destination.endswith(".json"):
+        import json
+        with open(destination, "w") as f:
+            json.dump(_capture_stats, f, indent=4, sort_keys=True)
+    else:
+        with open(destination, "w") as f:
+            f.write(_capture_stats_report())
+    _capture_stats.clear()
+
+
+class StdStreamCapturingMixin(unittest.TestCase):
+    """A test case mixin that captures stdout and stderr.
+
+    All data written to sys.stdout is captured, and available from the `stdout`
+    method.  That data is also still written to stdout.
+
+    The same is true for stderr, it's available from the `stderr` method. But
+    because some test runners don't capture stderr for you, stderr is only
+    written to stderr if you set `show_stderr` to True in your test class.
+
+    """
+
+    show_stderr = False
+
+    # Set this to True, or set the UNITTEST_MIXINS_CAPTURE_STATS environment
+    # variable, to count the writes to stdout and stderr, and time them.  The
+    # statistics are reported at exit.
+    instrument_capture = False
+
+    def setUp(self):
+        super(StdStreamCapturingMixin, self).setUp()
+
+        with _timing(self, "StdStreamCapturingMixin", "setup"):
+            # Capture stdout and stderr so we can examine them in tests.
+            # nose keeps stdout from littering the screen, so we can safely
+            # _Tee it, but it doesn't capture stderr, so we don't want to _Tee
+            # stderr to the real stderr, since it will interfere with our nice
+            # field of dots.
+            old_stdout = sys.stdout
+            self.captured_stdout = _CaptureStream()
+            old_stderr = sys.stderr
+            self.captured_stderr = _CaptureStream()
+
+            if self.instrument_capture or os.environ.get("UNITTEST_MIXINS_CAPTURE_STATS"):
+                _register_at_exit(_report_on_capture_stats)
+                stats = _capture_stats[self.id()] = {
+                    "stdout": _new_capture_stats(),
+                    "stderr": _new_capture_stats(),
+                }
+                sys.stdout = _InstrumentedTee(
+                    [sys.stdout, self.captured_stdout], ["terminal", "capture"], stats["stdout"],
+                )
+                if self.show_stderr:
+                    sys.stderr = _InstrumentedTee(
+                        [sys.stderr, self.captured_stderr], ["terminal", "capture"],
+                        stats["stderr"],
+                    )
+                else:
+                    # Count the writes in the capture stream itself, so that
+                    # stderr is still a complete text stream.
+                    self.captured_stderr = _InstrumentedCaptureStream(stats["stderr"])
+                    sys.stderr = self.captured_stderr
+            else:
+                sys.stdout = _Tee(sys.stdout, self.captured_stdout)
+                if self.show_stderr:
+                    sys.stderr = _Tee(sys.stderr, self.captured_stderr)
+                else:
+                    sys.stderr = self.captured_stderr
+
+            _add_timed_cleanup(
+                self, "StdStreamCapturingMixin", self._cleanup_std_streams, old_stdout, old_stderr,
+            )
+
+    def _cleanup_std_streams(self, old_stdout, old_stderr):
+        """Restore stdout and stderr."""
+        sys.stdout = old_stdout
+        sys.stderr = old_stderr
+
+    def stdout(self):
+        """Return the data written to stdout during the test."""
+        return self.captured_stdout.getvalue()
+
+    def stderr(self):
+        """Return the data written to stderr during the test."""
+        return self.captured_stderr.getvalue()
+
+    def stdout_bytes(self):
+        """Return the bytes written to stdout during the test.
+
+        This includes both text written to sys.stdout, encoded, and bytes
+        written to sys.stdout.buffer.
+
+        """
+        return self.captured_stdout.buffer.getvalue()
+
+    def stderr_bytes(self):
+        """Return the bytes written to stderr during the test."""
+        return self.captured_stderr.buffer.getvalue()
+
+
+# File descriptors and child processes that are meant to outlive the test
+# that created them, and so are not leaks.
+_long_lived_fds = set()
+_long_lived_pids = set()
+
+
+def _open_fds():
+    """Get a dict of this process's open file descriptors, or None.
+
+    The values describe the files, as well as we can tell.
+
+    """
+    for fd_dir in ["/proc/self/fd", "/dev/fd"]:
+        if os.path.isdir(fd_dir):
+            break
+    else:
+        return None
+
+    fds = {}
+    for name in os.listdir(fd_dir):
+        fd = int(name)
+        if fd in _long_lived_fds:
+            continue
+        try:
+            fds[fd] = os.readlink(os.path.join(fd_dir, name))
+        except OSError:
+            # Closed now (like the fd used by listdir), or not a link.
+            try:
+                os.fstat(fd)
+            except OSError:
+                continue
+            fds[fd] = "?"
+    return fds
+
+
+def _child_processes():
+    """Get a dict of this process's child processes, or None.
+
+    The keys are pids, the values are the process states ("Z" for a zombie).
+
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    pids = _listed_children()
+    if pids is None:
+        # The kernel doesn't list children, so check every process's parent.
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    my_pid = os.getpid()
+    children = {}
+    for pid in pids:
+        if pid in _long_lived_pids:
+            continue
+        stat = _process_stat(pid)
+        if stat is not None and stat[1] == my_pid:
+            children[pid] = stat[0]
+    return children
+
+
+def _listed_children(task_dir="/proc/self/task"):
+    """Get the pids of our children from the kernel's lists of them.
+
+    Each thread's children are in /proc/self/task/TID/children.  Returns
+    None if the kernel doesn't provide those files.
+
+    """
+    pids = []
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return None
+    for tid in tids:
+        try:
+            with open(os.path.join(task_dir, tid, "children")) as f:
+                pids.extend(int(pid) for pid in f.read().split())
+        except (IOError, OSError):
+            if os.path.isdir(os.path.join(task_dir, tid)):
+                # The thread is still there, but its children file isn't.
+                return None
+    return pids
+
+
+def _process_stat(pid):
+    """Get the (state, parent pid) of process `pid`, or None if it's gone."""
+    try:
+        with open("/proc/{0}/stat".format(pid)) as f:
+            stat = f.read()
+    except (IOError, OSError):
+        return None
+    # The command name is in parens, and might have spaces.
+    fields = stat[stat.rfind(")")+2:].split()
+    return fields[0], int(fields[1])
+
+
+class _ResourceSnapshot(object):
+    """The open fds, live threads, and child processes at some moment."""
+
+    def __init__(self):
+        import threading
+        self.fds = _open_fds()
+        self.threads = set(threading.enumerate())
+        self.children = _child_processes()
+
+    def leaks_since(self, earlier):
+        """What do we have that `earlier` didn't?
+
+        Returns a dict with "fds", "threads", and "children" keys.
+
+        """
+        leaks = {"fds": {}, "threads": [], "children": {}}
+        if self.fds is not None and earlier.fds is not None:
+            for fd, what in self.fds.items():
+                if earlier.fds.get(fd) != what:
+                    leaks["fds"][fd] = what
+        leaks["threads"] = [t for t in self.threads - earlier.threads if t.is_alive()]
+        if self.children is not None and earlier.children is not None:
+            for pid, state in self.children.items():
+                if pid not in earlier.children:
+                    leaks["children"][pid] = state
+        return leaks
+
+
+def _describe_leaks(leaks):
+    """Make a list of lines describing `leaks`."""
+    lines = []
+    for fd, what in sorted(leaks["fds"].items()):
+        lines.append("file descriptor {0}: {1}".format(fd, what))
+    for thread in leaks["threads"]:
+        lines.append("thread {0!r}".format(thread.name))
+    for pid, state in sorted(leaks["children"].items()):
+        lines.append("child process {0}{1}".format(pid, " (zombie)" if state == "Z" else ""))
+    return lines
+
+
+class ResourceLeakMixin(unittest.TestCase):
+    """A test case mixin that finds resources leaked by a test.
+
+    Open file descriptors, live threads, and child processes are recorded
+    before the test, and compared to what there is afterward.  Anything new
+    is a leak.
+
+    `leak_check` determines what happens with leaks: "fail" fails the test,
+    "warn" issues a ResourceWarning, and None does nothing.  If
+    `reap_leaks` is True, leaked file descriptors are closed and leaked
+    child processes are terminated and reaped.  Threads can't be stopped,
+    so they are only reported.
+
+    File descriptors and child processes can only be found where /proc is
+    available.
+
+    """
+
+    # What to do about leaks: "fail", "warn", or None.
+    leak_check = "fail"
+
+    # Set this to True to clean up leaked fds and child processes.
+    reap_leaks = False
+
+    # How long to wait for leaked threads and child processes to finish on
+    # their own before calling them leaks.
+    leak_grace_time = 0.1
+
+    def setUp(self):
+        super(ResourceLeakMixin, self).setUp()
+
+        if self.leak_check or self.reap_leaks:
+            self._resources_before = _ResourceSnapshot()
+            self.addCleanup(self._check_leaks)
+
+    def _check_leaks(self):
+        """Find leaks, and deal with them."""
+        leaks = _ResourceSnapshot().leaks_since(self._resources_before)
+        if leaks["threads"] or leaks["children"]:
+            # Give them a moment to finish, and look again.
+            deadline = _clock() + self.leak_grace_time
+            for thread in leaks["threads"]:
+                thread.join(max(0, deadline - _clock()))
+            while leaks["children"] and _clock() < deadline:
+                time.sleep(0.01)
+                leaks = _ResourceSnapshot().leaks_since(self._resources_before)
+            leaks = _ResourceSnapshot().leaks_since(self._resources_before)
+
+        descriptions = _describe_leaks(leaks)
+        if self.reap_leaks:
+            _reap_leaks(leaks)
+        if not descriptions:
+            return
+
+        message = "{0} leaked resources:\n{1}".format(
+            self.id(), "".join("    {0}\n".format(d) for d in descriptions),
+        )
+        if self.leak_check == "fail":
+            raise self.failureException(message)
+        elif self.leak_check == "warn":
+            import warnings
+            warnings.warn(message, ResourceWarning if PY3 else RuntimeWarning)
+
+
+def _reap_leaks(leaks):
+    """Close leaked fds, and stop leaked child processes."""
+    import signal
+
+    for fd in leaks["fds"]:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    for pid, state in leaks["children"].items():
+        try:
+            if state != "Z":
+                os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+
+class _DelayedFailure(object):
+    """A failed assertion collected by `delayed_assertions`.
+
+    Only the kind of assertion and its operands are kept.  The message isn't
+    rendered until `render` is called, when the failures are reported.
+
+    """
+
+    def __init__(self, kind, *operands):
+        self.kind = kind
+        self.operands = operands
+        # "filename:lineno" of the assertion that failed.
+        self.location = None
+
+    def render(self, testcase):
+        """Produce the failure message, as `testcase` would have."""
+        if self.kind == "fail":
+            msg, = self.operands
+            return msg
+        else:
+            first, second, msg = self.operands
+            return _render_multi_line_inequality(testcase, first, second, msg)
+
+
+# Lines of unchanged context to show around the changes in a diff.
+DIFF_CONTEXT_LINES = 3
+
+# Changed regions with more lines than this get a simpler diff than ndiff's.
+DIFF_NDIFF_MAX_LINES = 500
+
+# How far ahead the simpler diff looks for lines that match again.
+DIFF_LOOKAHEAD_LINES = 500
+
+# The most lines the simpler diff will produce.
+DIFF_MAX_LINES = 1000
+
+# How many lines to look at when deciding if two lists of lines have anything
+# in common worth diffing.
+DIFF_SAMPLE_LINES = 100000
+
+
+def _short_repr(text, length=60):
+    """A repr of `text`, truncated to about `length` characters."""
+    text_repr = repr(text[:length+1])
+    if len(text_repr) > length:
+        text_repr = text_repr[:length] + "..."
+    return text_repr
+
+
+def _truncate(text, size):
+    """Limit `text` to `size` characters, noting how much was cut off."""
+    if size is None or len(text) <= size:
+        return text
+    return "{0}\n[... {1} more characters]".format(text[:size], len(text) - size)
+
+
+# Sequences are compared this many items at a time, at first, when looking for
+# where they differ.  The blocks grow as long as they match, up to the maximum.
+COMPARE_BLOCK_MIN = 1024
+COMPARE_BLOCK_MAX = 1024 * 1024
+
+
+def _common_prefix_length(a, b, a_start=0, b_start=0):
+    """How many items are the same in `a` and `b`, from `a_start` and `b_start`?"""
+    most = min(len(a) - a_start, len(b) - b_start)
+    same = 0
+    block = COMPARE_BLOCK_MIN
+    while same < most:
+        size = min(block, most - same)
+        a_at, b_at = a_start + same, b_start + same
+        if a[a_at:a_at+size] != b[b_at:b_at+size]:
+            # The difference is in this block: binary-search for it.
+            lo, hi = 0, size - 1
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if a[a_at:a_at+mid] == b[b_at:b_at+mid]:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            return same + lo
+        same += size
+        block = min(block * 2, COMPARE_BLOCK_MAX)
+    return same
+
+
+def _common_suffix_length(a, b, most):
+    """How many items at the end of `a` and `b` are the same, up to `most`?"""
+    same = 0
+    block = COMPARE_BLOCK_MIN
+    len_a, len_b = len(a), len(b)
+    while same < most:
+        size = min(block, most - same)
+        a_end, b_end = len_a - same, len_b - same
+        if a[a_end-size:a_end] != b[b_end-size:b_end]:
+            lo, hi = 0, size - 1
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if a[a_end-mid:a_end] == b[b_end-mid:b_end]:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            return same + lo
+        same += size
+        block = min(block * 2, COMPARE_BLOCK_MAX)
+    return same
+
+
+def _ended_lines(text, mark_no_newline=False):
+    """Split `text` into lines, all of them ending with a newline.
+
+    If `mark_no_newline` is true and the last line had no newline, a marker
+    line like difflib's follows it, so that the missing newline shows as a
+    difference.
+
+    """
+    lines = text.splitlines(True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+        if mark_no_newline:
+            lines.append("\\ No newline at end of file\n")
+    return lines
+
+
+def _plain_diff(first_lines, second_lines):
+    """A simple diff of two long lists of lines, as a list of lines.
+
+    Matching runs are skipped a block at a time.  At each difference, the next
+    few hundred lines of each side are hashed to find where they match again.
+    Only the first DIFF_MAX_LINES lines of the diff are produced.
+
+    """
+    diff = []
+    i = j = 0
+    while i < len(first_lines) or j < len(second_lines):
+        if len(diff) >= DIFF_MAX_LINES:
+            diff.append("[... more differences not shown]\n")
+            break
+
+        same = _common_prefix_length(first_lines, second_lines, i, j)
+        if same:
+            unchanged = first_lines[i:i+same]
+            if same > 2 * DIFF_CONTEXT_LINES:
+                diff.extend("  " + line for line in unchanged[:DIFF_CONTEXT_LINES])
+                diff.append("[... {0} unchanged lines]\n".format(same - 2 * DIFF_CONTEXT_LINES))
+                unchanged = unchanged[-DIFF_CONTEXT_LINES:]
+            diff.extend("  " + line for line in unchanged)
+            i += same
+            j += same
+            continue
+
+        # Find the nearest place where the two sides match again.
+        ahead = dict(
+            (line, k) for k, line in reversed(list(enumerate(
+                second_lines[j:j+DIFF_LOOKAHEAD_LINES], start=j,
+            )))
+        )
+        i_next, j_next = i + DIFF_LOOKAHEAD_LINES, j + DIFF_LOOKAHEAD_LINES
+        for k, line in enumerate(first_lines[i:i+DIFF_LOOKAHEAD_LINES], start=i):
+            if line in ahead:
+                if k + ahead[line] < i_next + j_next:
+                    i_next, j_next = k, ahead[line]
+        diff.extend("- " + line for line in first_lines[i:i_next])
+        diff.extend("+ " + line for line in second_lines[j:j_next])
+        i, j = min(i_next, len(first_lines)), min(j_next, len(second_lines))
+    return diff
+
+
+def _window_diff(first_lines, second_lines):
+    """Diff two lists of lines, fast even if they are long.
+
+    Short lists get an ndiff.  Long lists with hardly any lines in common
+    (judging by their first DIFF_SAMPLE_LINES lines) get a summary, and other
+    long lists get a plain diff without ndiff's intraline hints.
+
+    """
+    if len(first_lines) + len(second_lines) <= DIFF_NDIFF_MAX_LINES:
+        return list(difflib.ndiff(first_lines, second_lines))
+
+    first_set = set(first_lines[:DIFF_SAMPLE_LINES])
+    second_set = set(second_lines[:DIFF_SAMPLE_LINES])
+    common = len(first_set & second_set)
+    if common * 10 < min(len(first_set), len(second_set)):
+        return [
+            "[diff omitted: {0} and {1} distinct lines, {2} in common]\n".format(
+                len(first_set), len(second_set), common,
+            )
+        ]
+    return _plain_diff(first_lines, second_lines)
+
+
+def _multi_line_diff(first, second):
+    """A diff of two unequal multi-line strings, as a list of lines.
+
+    The unchanged text at the start and end is found without splitting the
+    strings into lines, and only the window of lines between them is diffed.
+    A few lines of unchanged context are shown on either side of the window.
+
+    """
+    # The window starts at the beginning of the line with the first
+    # difference.
+    start = _common_prefix_length(first, second)
+    start = first.rfind("\n", 0, start) + 1
+
+    # The window ends after the last difference, at the beginning of a line
+    # in both strings.  If the common suffix doesn't start a line in both,
+    # it's shortened to start after its first newline, which is in both.
+    suffix = _common_suffix_length(first, second, min(len(first), len(second)) - start)
+    first_end = len(first) - suffix
+    second_end = len(second) - suffix
+    at_line_starts = (
+        (first_end == 0 or first[first_end-1] == "\n") and
+        (second_end == 0 or second[second_end-1] == "\n")
+    )
+    if suffix and not at_line_starts:
+        newline = first.find("\n", first_end)
+        if newline < 0:
+            first_end, second_end = len(first), len(second)
+        else:
+            second_end += newline + 1 - first_end
+            first_end = newline + 1
+
+    before = start
+    for _ in range(DIFF_CONTEXT_LINES):
+        if before == 0:
+            break
+        before = first.rfind("\n", 0, before - 1) + 1
+    after = first_end
+    for _ in range(DIFF_CONTEXT_LINES):
+        if after == len(first):
+            break
+        newline = first.find("\n", after)
+        after = len(first) if newline < 0 else newline + 1
+
+    diff = []
+    if before > 0:
+        diff.append("[... {0} unchanged lines]\n".format(first.count("\n", 0, before)))
+    diff.extend("  " + line for line in _ended_lines(first[before:start]))
+    # If only one string ends with a newline, the window reaches the end of
+    # both, and the missing newline is marked.
+    mark = first.endswith("\n") != second.endswith("\n")
+    diff.extend(_window_diff(
+        _ended_lines(first[start:first_end], mark),
+        _ended_lines(second[start:second_end], mark),
+    ))
+    diff.extend("  " + line for line in _ended_lines(first[first_end:after]))
+    if after < len(first):
+        lines_after = first.count("\n", after) + (not first.endswith("\n"))
+        diff.append("[... {0} unchanged lines]\n".format(lines_after))
+    return diff
+
+
+def _render_multi_line_inequality(testcase, first, second, msg):
+    """The failure message for unequal multi-line strings.
+
+    This is like `assertMultiLineEqual`'s message, but only the lines around
+    the changes are shown, so that it's quick to produce even for huge
+    strings.
+
+    """
+    standard_msg = "{0} != {1}\n{2}".format(
+        _short_repr(first), _short_repr(second), "".join(_multi_line_diff(first, second)),
+    )
+    return testcase._formatMessage(msg, standard_msg)
+
+
+class _TooManyDelayedFailures(BaseException):
+    """Raised to end a `delayed_assertions` block early.
+
+    It's a BaseException so that an ``except Exception`` in the block doesn't
+    swallow it.
+
+    """
+
+
+class _DelayingContext(object):
+    """Wraps an assertion context manager, like the one from `assertRaises`.
+
+    The code in the with-statement is run normally, with no delaying, and a
+    failure from the context manager itself is collected.
+
+    """
+
+    def __init__(self, testcase, context, location):
+        self._testcase = testcase
+        self._context = context
+        self._location = location
+
+    def __getattr__(self, name):
+        # Like the `exception` attribute of an assertRaises context.
+        return getattr(self._context, name)
+
+    def __enter__(self):
+        self._testcase._delayed_suspended += 1
+        return self._context.__enter__()
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        testcase = self._testcase
+        testcase._delayed_suspended -= 1
+        try:
+            return self._context.__exit__(exc_type, exc_value, exc_tb)
+        except testcase.failureException as exc:
+            testcase._delayed_location = self._location
+            testcase._record_delayed_failure(_DelayedFailure("fail", str(exc)))
+            return True
+
+
+def _frame_location(frame):
+    """The "filename:lineno" of where `frame` is executing."""
+    return "{0}:{1}".format(frame.f_code.co_filename, frame.f_lineno)
+
+
+# Map from class to the names of its assertion methods.
+_assertion_method_names = {}
+
+
+def _assertion_methods(klass):
+    """The names of all the assertion methods in `klass`."""
+    names = _assertion_method_names.get(klass)
+    if names is None:
+        names = _assertion_method_names[klass] = [
+            name for name in dir(klass)
+            if name.startswith(("assert", "fail")) and inspect.isroutine(getattr(klass, name))
+        ]
+    return names
+
+
+class DelayedAssertionMixin(unittest.TestCase):
+    """A test case mixin that provides a `delayed_assertions` context manager.
+
+    Use it like this::
+
+        with self.delayed_assertions():
+            self.assertEqual(x, y)
+            self.assertEqual(z, w)
+
+    All of the assertions will run.  The failures will be displayed at the end
+    of the with-statement, with the locations of the assertions that failed.
+
+    Every assertion method is delayed, including `fail`, the assertion context
+    managers like `assertRaises`, and your own methods whose names start with
+    "assert".  Use `delayed_assertions(max_failures=N)` to stop the block
+    early once N assertions have failed.
+
+    Failure messages for string comparisons aren't rendered until the end of
+    the with-statement.  All messages are limited in size by
+    `delayed_failure_max_size` (for each failure) and `delayed_total_max_size`
+    (for all of them).
+
+    """
+
+    # The most characters to show for one delayed failure, and for all of the
+    # delayed failures together.  None means no limit.
+    delayed_failure_max_size = 10000
+    delayed_total_max_size = 100000
+
+    def __init__(self, *args, **kwargs):
+        super(DelayedAssertionMixin, self).__init__(*args, **kwargs)
+        # In Python 2.7, `assertEqual` didn't use `assertMultiLineEqual` for
+        # strings, but we can do what Python 3 does, so that string
+        # comparisons are rendered lazily.
+        self.addTypeEqualityFunc(str, 'assertMultiLineEqual')
+        self._delayed_assertions = None
+        self._delayed_max_failures = None
+        # How deeply nested we are in delayed assertion methods.
+        self._delayed_depth = 0
+        # How many assertion context managers we are in.
+        self._delayed_suspended = 0
+        # The location of the outermost assertion being run.
+        self._delayed_location = None
+
+    @contextlib.contextmanager
+    def delayed_assertions(self, max_failures=None):
+        """The context manager: assert that we didn't collect any assertions."""
+        self._delayed_assertions = []
+        self._delayed_max_failures = max_failures
+        names = _assertion_methods(self.__class__)
+        saved = dict((name, self.__dict__[name]) for name in names if name in self.__dict__)
+        for name in names:
+            method = getattr(self, name)
+            if name == "assertMultiLineEqual":
+                method = self._delayed_multi_line_equal
+            setattr(self, name, self._delaying(method))
+
+        stopped_early = False
+        try:
+            yield
+        except _TooManyDelayedFailures:
+            stopped_early = True
+        finally:
+            for name in names:
+                if name in saved:
+                    setattr(self, name, saved[name])
+                else:
+                    delattr(self, name)
+        if self._delayed_assertions:
+            self.fail(self._render_delayed_assertions(stopped_early))
+
+    def _delaying(self, method):
+        """Wrap an assertion method so that its failure is collected.
+
+        Only the outermost assertion method collects a failure, so that one
+        assertion calling another only fails once.
+
+        """
+        @functools.wraps(method)
+        def delaying(*args, **kwargs):
+            if self._delayed_depth or self._delayed_suspended:
+                return method(*args, **kwargs)
+
+            location = _frame_location(sys._getframe(1))
+            self._delayed_location = location
+            self._delayed_depth += 1
+            try:
+                result = method(*args, **kwargs)
+            except self.failureException as exc:
+                self._record_delayed_failure(_DelayedFailure("fail", str(exc)))
+                return None
+            finally:
+                self._delayed_depth -= 1
+
+            if hasattr(result, "__exit__"):
+                result = _DelayingContext(self, result, location)
+            return result
+        return delaying
+
+    def _record_delayed_failure(self, failure):
+        """Collect a failure, and stop if we've collected too many."""
+        failure.location = self._delayed_location
+        self._delayed_assertions.append(failure)
+        max_failures = self._delayed_max_failures
+        if max_failures is not None and len(self._delayed_assertions) >= max_failures:
+            raise _TooManyDelayedFailures()
+
+    def _render_delayed_assertions(self, stopped_early=False):
+        """Render the collected failures into one message."""
+        failures = self._delayed_assertions
+        messages = []
+        total = 0
+        for failure in failures:
+            # The first failure is always shown, however small the total size.
+            too_much = (
+                self.delayed_total_max_size is not None and total >= self.delayed_total_max_size
+            )
+            if messages and too_much:
+                break
+            message = _truncate(failure.render(self), self.delayed_failure_max_size)
+            messages.append(message)
+            total += len(message)
+
+        if len(failures) == 1:
+            text = messages[0]
+        else:
+            text = "{0} failed assertions:\n{1}".format(len(failures), "\n".join(messages))
+            if len(messages) < len(failures):
+                text += "\n[... {0} more failed assertions]".format(
+                    len(failures) - len(messages)
+                )
+        text += "\nFailed at:\n{0}".format(
+            "".join("    {0}\n".format(f.location) for f in failures[:len(messages)])
+        )
+        if stopped_early:
+            text += "[stopped after {0} failed assertions]\n".format(len(failures))
+        return text
+
+    def assertMultiLineEqual(self, first, second, msg=None):
+        """Assert that two multi-line strings are equal.
+
+        Unlike `unittest.TestCase.assertMultiLineEqual`, the failure message
+        only diffs the lines that changed, so it's fast for huge strings.
+
+        """
+        self.assertIsInstance(first, _string_types, 'First argument is not a string')
+        self.assertIsInstance(second, _string_types, 'Second argument is not a string')
+        if first != second:
+            self.fail(_render_multi_line_inequality(self, first, second, msg))
+
+    def _delayed_multi_line_equal(self, first, second, msg=None):
+        """The stand-in for assertMultiLineEqual during delayed_assertions.
+
+        Equal strings are cheap to check.  Unequal ones are recorded, and only
+        diffed if the failure is rendered.
+
+        """
+        both_strings = (
+            isinstance(first, _string_types) and isinstance(second, _string_types)
+        )
+        if self._delayed_suspended or not both_strings:
+            DelayedAssertionMixin.assertMultiLineEqual(self, first, second, msg)
+        elif first != second:
+            self._record_delayed_failure(
+                _DelayedFailure("assertMultiLineEqual", first, second, msg)
+            )
+
+
+# Map from profile directory to a list of (test id, cProfile stats file or
+# None, memory growth lines or None) for the tests profiled into it.
+_profiles = {}
+
+
+def _test_slug(test_id):
+    """Make a test id usable in a file name."""
+    return re.sub(r"[^\w]+", "_", test_id)
+
+
+@contextlib.contextmanager
+def _profiled(test_id, directory, kinds, memory_top):
+    """Profile the with-statement as the test `test_id`.
+
+    `kinds` is a set of "cpu" (run cProfile) and "memory" (run tracemalloc).
+    Stats are written to files in `directory`, named for the test.
+
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    slug = _test_slug(test_id)
+
+    profiler = None
+    if "cpu" in kinds:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    tracemalloc = None
+    if "memory" in kinds:
+        try:
+            import tracemalloc
+        except ImportError:         # pragma: no cover
+            pass
+
+    started_tracing = False
+    if tracemalloc is not None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        before = tracemalloc.take_snapshot()
+
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            prof_file = os.path.join(directory, slug + ".prof")
+            profiler.dump_stats(prof_file)
+        else:
+            prof_file = None
+
+        if tracemalloc is not None:
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            growth = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+            memory_lines = [str(stat) for stat in growth[:memory_top]]
+            with open(os.path.join(directory, slug + ".memory.txt"), "w") as f:
+                f.write("".join(line + "\n" for line in memory_lines))
+        else:
+            memory_lines = None
+
+        _profiles.setdefault(directory, []).append((test_id, prof_file, memory_lines))
+
+
+def _report_on_profiles():
+    """Called at process exit to combine the per-test profiles.
+
+    In each profile directory, "combined.prof" has the cProfile stats of all
+    the tests, and "memory.txt" lists the top memory growers for each test.
+
+    """
+    import pstats
+
+    for directory, profiles in _profiles.items():
+        prof_files = [p for _, p, _ in profiles if p is not None and os.path.exists(p)]
+        if prof_files:
+            stats = pstats.Stats(*prof_files)
+            stats.dump_stats(os.path.join(directory, "combined.prof"))
+
+        memory = [(test_id, lines) for test_id, _, lines in profiles if lines is not None]
+        if memory and os.path.isdir(directory):
+            with open(os.path.join(directory, "memory.txt"), "w") as f:
+                for test_id, lines in memory:
+                    f.write("{0}:\n".format(test_id))
+                    for line in lines:
+                        f.write("    {0}\n".format(line))
+    _profiles.clear()
+
+
+class ProfilingMixin(unittest.TestCase):
+    """A test case mixin that profiles each test, when asked to.
+
+    Set `profile_tests` in your class, or the UNITTEST_MIXINS_PROFILE
+    environment variable, to "cpu" to run each test under cProfile, "memory"
+    to track memory growth with tracemalloc, or "cpu,memory" for both.
+
+    Each test's stats are written to `profile_dir` (or the directory named by
+    UNITTEST_MIXINS_PROFILE_DIR, or "test_profiles" in the current
+    directory).  At exit, they are combined into "combined.prof" and
+    "memory.txt" in the same directory.
+
+    """
+
+    # What kinds of profiling to do: "cpu", "memory", or "cpu,memory".
+    profile_tests = None
+
+    # Where to write the profiling stats.
+    profile_dir = None
+
+    # How many of the top memory growers to record for each test.
+    profile_memory_top = 10
+
+    def setUp(self):
+        # Find the directory before other mixins might change directories.
+        kinds = os.environ.get("UNITTEST_MIXINS_PROFILE") or self.profile_tests
+        if kinds:
+            kinds = set(kind.strip() for kind in kinds.split(","))
+            directory = os.path.abspath(
+                self.profile_dir or
+                os.environ.get("UNITTEST_MIXINS_PROFILE_DIR") or
+                "test_profiles"
+            )
+
+        super(ProfilingMixin, self).setUp()
+
+        if kinds:
+            _register_at_exit(_report_on_profiles)
+            setup_with_context_manager(
+                self, _profiled(self.id(), directory, kinds, self.profile_memory_top)
+            )
+
+
+# The measurements of each test run under PerformanceBudgetMixin, and the
+# budgets they went over.
+_budget_measurements = {}
+_budget_violations = []
+
+# Budget configuration files, read once each.
+_budget_configs = {}
+
+# The measurements a budget can limit.
+BUDGET_MEASUREMENTS = ["wall_time", "peak_rss_delta", "temp_dir_bytes"]
+
+
+def _peak_rss():
+    """The peak resident set size of this process in bytes, or None."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        # Linux reports kilobytes, macOS reports bytes.
+        peak *= 1024
+    return peak
+
+
+def _read_budget_config(filename):
+    """Read a budget configuration file.
+
+    A missing file raises an error, rather than quietly having no budgets.
+
+    """
+    filename = os.path.abspath(filename)
+    if filename not in _budget_configs:
+        import json
+        with open(filename) as f:
+            _budget_configs[filename] = json.load(f)
+    return _budget_configs[filename]
+
+
+def _budget_for(config, test_id):
+    """Find the budget for `test_id` in `config`.
+
+    Test budgets override class budgets, which override the default budget.
+
+    """
+    class_id = test_id.rpartition(".")[0]
+    budget = dict(config.get("default", {}))
+    budget.update(config.get("classes", {}).get(class_id, {}))
+    budget.update(config.get("tests", {}).get(test_id, {}))
+    return budget
+
+
+def _check_budget(test_id, measurements, budget, tolerance):
+    """Make a list of messages about the measurements that are over budget."""
+    violations = []
+    for name in BUDGET_MEASUREMENTS:
+        limit = budget.get(name)
+        measured = measurements.get(name)
+        if limit is None or measured is None:
+            continue
+        if measured > limit * (1 + tolerance):
+            violations.append(
+                "{0}: {1} was {2:.6g}, over the budget of {3:.6g}".format(
+                    test_id, name, measured, limit,
+                )
+            )
+    return violations
+
+
+def _report_on_budgets():
+    """Called at process exit to report on performance budgets.
+
+    Budget violations are printed.  If the UNITTEST_MIXINS_BUDGET_BASELINE
+    environment variable names a file, the measurements are written there as
+    a new budget configuration.
+
+    """
+    for violation in _budget_violations:
+        print("Over budget: " + violation)
+
+    destination = os.environ.get("UNITTEST_MIXINS_BUDGET_BASELINE")
+    if destination and _budget_measurements:
+        import json
+        baseline = {"tests": _budget_measurements}
+        if os.path.exists(destination):
+            # Keep the settings from an existing baseline.
+            with open(destination) as f:
+                old = json.load(f)
+            for key in ["tolerance", "default", "classes"]:
+                if key in old:
+                    baseline[key] = old[key]
+            old_tests = old.get("tests", {})
+            old_tests.update(_budget_measurements)
+            baseline["tests"] = old_tests
+        with open(destination, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+
+    _budget_measurements.clear()
+    del _budget_violations[:]
+
+
+class PerformanceBudgetMixin(unittest.TestCase):
+    """A test case mixin that measures tests against performance budgets.
+
+    Each test's wall time (in seconds), the growth in the process's peak
+    resident set size (in bytes), and the size of its temp directory (in
+    bytes, if it has one) are measured.
+
+    The budgets are read from the JSON file named by `performance_budgets`, or
+    the UNITTEST_MIXINS_BUDGETS environment variable, relative to the current
+    directory before the test starts.  It's an error if the file is missing::
+
+        {
+            "tolerance": 0.1,
+            "default": {"wall_time": 1.0},
+            "classes": {"tests.test_big.BigTest": {"peak_rss_delta": 50000000}},
+            "tests": {"tests.test_big.BigTest.test_huge": {"wall_time": 10.0}}
+        }
+
+    A test's budget comes from its entry in "tests", then its class's entry
+    in "classes", then "default".  A test is over budget if a measurement is
+    more than its budget plus the tolerance, a fraction of the budget.  At
+    exit, tests over budget are reported.
+
+    Set UNITTEST_MIXINS_BUDGET_BASELINE to a file name to write the
+    measurements there at exit, as the "tests" budgets in a new
+    configuration file.
+
+    """
+
+    # The JSON file of budgets.
+    performance_budgets = None
+
+    def setUp(self):
+        # Read the budgets before other mixins might change directories.
+        config_file = os.environ.get("UNITTEST_MIXINS_BUDGETS") or self.performance_budgets
+        config = _read_budget_config(config_file) if config_file else {}
+
+        super(PerformanceBudgetMixin, self).setUp()
+
+        if config_file or os.environ.get("UNITTEST_MIXINS_BUDGET_BASELINE"):
+            _register_at_exit(_report_on_budgets)
+            self.addCleanup(self._check_budget, config)
+            self._budget_rss_start = _peak_rss()
+            self._budget_start = _clock()
+
+    def _check_budget(self, config):
+        """Measure the test, and compare it to its budget."""
+        measurements = {"wall_time": _clock() - self._budget_start}
+        rss = _peak_rss()
+        if rss is not None:
+            measurements["peak_rss_delta"] = rss - self._budget_rss_start
+        temp_dir = getattr(self, "temp_dir", None)
+        if temp_dir and os.path.isdir(temp_dir):
+            measurements["temp_dir_bytes"] = _dir_size(temp_dir)
+
+        test_id = self.id()
+        _budget_measurements[test_id] = measurements
+        _budget_violations.extend(
+            _check_budget(
+                test_id, measurements, _budget_for(config, test_id), config.get("tolerance", 0),
+            )
+        )
+
+
+class ForkedTestError(Exception):
+    """An error in a test that ran in a forked child process.
+
+    The message is the traceback from the child.
+
+    """
+
+
+class _RecordingResult(unittest.TestResult):
+    """A TestResult that records what happened, so it can be replayed.
+
+    The events are tuples of strings, so they can be pickled and sent from a
+    forked child to its parent.
 
-    def cleanup_modules(self):
-        """Remove any new modules imported since our construction.
+    """
 
-        This lets us import the same source files for more than one test, or
-        if called explicitly, within one test.
+    def __init__(self):
+        super(_RecordingResult, self).__init__()
+        self.events = []
 
-        """
-        for m in [m for m in sys.modules if m not in self._old_modules]:
-            del sys.modules[m]
+    def startTest(self, test):
+        self.events.append(("startTest",))
 
+    def stopTest(self, test):
+        self.events.append(("stopTest",))
 
-class ModuleAwareMixin(unittest.TestCase):
-    """A test case mixin that isolates changes to sys.modules."""
+    def addSuccess(self, test):
+        self.events.append(("addSuccess",))
 
-    def setUp(self):
-        super(ModuleAwareMixin, self).setUp()
+    def addFailure(self, test, err):
+        self.events.append(("addFailure", self._exc_info_to_string(err, test)))
 
-        self._module_cleaner = ModuleCleaner()
-        self.addCleanup(self._module_cleaner.cleanup_modules)
+    def addError(self, test, err):
+        self.events.append(("addError", self._exc_info_to_string(err, test)))
 
-    def cleanup_modules(self):
-        self._module_cleaner.cleanup_modules()
+    def addSkip(self, test, reason):
+        self.events.append(("addSkip", reason))
 
+    def addExpectedFailure(self, test, err):
+        self.events.append(("addExpectedFailure", self._exc_info_to_string(err, test)))
 
-class SysPathAwareMixin(unittest.TestCase):
-    """A test case mixin that isolates changes to sys.path."""
+    def addUnexpectedSuccess(self, test):
+        self.events.append(("addUnexpectedSuccess",))
 
-    def setUp(self):
-        super(SysPathAwareMixin, self).setUp()
-        setup_with_context_manager(self, saved_sys_path())
+    def addSubTest(self, test, subtest, err):
+        if err is not None:
+            if issubclass(err[0], test.failureException):
+                kind = "addFailure"
+            else:
+                kind = "addError"
+            self.events.append(
+                (kind, "{0}\n{1}".format(subtest, self._exc_info_to_string(err, test)))
+            )
 
 
-class EnvironmentAwareMixin(unittest.TestCase):
-    """A test case mixin that isolates changes to the environment."""
+def _exc_info(exc):
+    """Get an exc_info tuple for the exception `exc`.
 
-    def setUp(self):
-        super(EnvironmentAwareMixin, self).setUp()
+    The exceptions we report have the child's traceback as their message, so
+    a traceback of where we made them would only get in the way.  Test
+    runners need a real traceback though, so the exception is raised in a
+    module whose frames they leave out.
 
-        # Record environment variables that we changed with set_environ.
-        self._environ_undos = {}
+    """
+    from ._hidden import exc_info
+    return exc_info(exc)
 
-        self.addCleanup(self._cleanup_environ)
 
-    def set_environ(self, name, value):
-        """Set an environment variable `name` to be `value`.
+def _replay_events(test, events, result):
+    """Report the recorded `events` for `test` to `result`."""
+    for event in events:
+        kind, args = event[0], event[1:]
+        if kind in ["startTest", "stopTest", "addSuccess", "addUnexpectedSuccess"]:
+            getattr(result, kind)(test)
+        elif kind == "addSkip":
+            result.addSkip(test, args[0])
+        elif kind == "addFailure":
+            result.addFailure(test, _exc_info(test.failureException(args[0])))
+        elif kind == "addError":
+            result.addError(test, _exc_info(ForkedTestError(args[0])))
+        elif kind == "addExpectedFailure":
+            result.addExpectedFailure(test, _exc_info(ForkedTestError(args[0])))
 
-        The environment variable is set, and record is kept that it was set,
-        so that `cleanup_environ` can restore its original value.
 
-        """
-        if name not in self._environ_undos:
-            self._environ_undos[name] = os.environ.get(name)
-        os.environ[name] = value
+def _reset_exit_records():
+    """Forget everything recorded for the exit reports.
 
-    def del_environ(self, name):
-        """Delete an environment variable, unless we set it.
+    A forked child does this before running its test, so that it can send
+    just what its test recorded back to its parent.
 
-        The environment variable is deleted, unless it had been set by an
-        earlier call to `set_environ` in the same test method.  This can be
-        used to isolate your test from environment variables leaking into your
-        tests, while still allowing your test to affect the particular
-        variables it needs to.
+    """
+    _mixin_timings.reset()
+    TempDirMixin._class_behaviors.clear()
+    _profiles.clear()
+    _budget_measurements.clear()
+    del _budget_violations[:]
+    _capture_stats.clear()
 
-        Attempting to delete a variable that doesn't exist is fine, it does not
-        raise an exception.
 
-        """
-        if name not in self._environ_undos and name in os.environ:
-            self._environ_undos[name] = os.environ.get(name)
-            del os.environ[name]
+def _exit_records(klass):
+    """Get what has been recorded for the exit reports, to send to a parent.
 
-    def _cleanup_environ(self):
-        """Undo all the changes made by `set_environ`."""
-        for name, value in self._environ_undos.items():
-            if value is None:
-                del os.environ[name]
-            else:
-                os.environ[name] = value
+    Only the class behavior of `klass` is included.
 
+    """
+    behavior = TempDirMixin._class_behaviors.get(klass)
+    if behavior is not None:
+        behavior = dict((k, v) for k, v in vars(behavior).items() if k != "klass")
+    return {
+        "timings": _mixin_timings.raw(),
+        "class_behavior": behavior,
+        "profiles": list(_profiles.items()),
+        "budget_measurements": list(_budget_measurements.items()),
+        "budget_violations": list(_budget_violations),
+        "capture_stats": list(_capture_stats.items()),
+    }
 
-class StdStreamCapturingMixin(unittest.TestCase):
-    """A test case mixin that captures stdout and stderr.
 
-    All data written to sys.stdout is captured, and available from the `stdout`
-    method.  That data is also still written to stdout.
+def _merge_exit_records(klass, records):
+    """Add the `records` from a forked child running a `klass` test to ours.
 
-    The same is true for stderr, it's available from the `stderr` method. But
-    because some test runners don't capture stderr for you, stderr is only
-    written to stderr if you set `show_stderr` to True in your test class.
+    The exit reports for whatever was recorded are registered here, since
+    the mixins' setUp that would have registered them ran in the child.
 
     """
+    if records["timings"]:
+        _mixin_timings.merge(records["timings"])
+        _register_at_exit(_report_on_mixin_timings)
+    if records["class_behavior"] is not None:
+        behavior = TempDirMixin._class_behaviors[klass]
+        behavior.klass = klass
+        behavior.merge(records["class_behavior"])
+        _register_at_exit(TempDirMixin._report_on_class_behavior)
+    if records["profiles"]:
+        for directory, profiles in records["profiles"]:
+            _profiles.setdefault(directory, []).extend(profiles)
+        _register_at_exit(_report_on_profiles)
+    if records["budget_measurements"]:
+        _budget_measurements.update(records["budget_measurements"])
+        _budget_violations.extend(records["budget_violations"])
+        _register_at_exit(_report_on_budgets)
+    if records["capture_stats"]:
+        _capture_stats.update(records["capture_stats"])
+        _register_at_exit(_report_on_capture_stats)
+
+
+class ForkIsolationMixin(unittest.TestCase):
+    """A test case mixin that runs each test in a forked child process.
+
+    The child is forked from the test process after class setup, so whatever
+    the test does to global state (sys.modules, sys.path, the environment,
+    and so on) is simply thrown away with the child.  The results are sent
+    back to the parent and reported there, along with what the test recorded
+    for the exit reports (class behavior, mixin timings, profiles, budgets,
+    and capture statistics).
+
+    Where os.fork isn't available, tests run normally.  Use
+    `run_forked_tests` to run several of these tests at once.
 
-    show_stderr = False
+    """
 
-    def setUp(self):
-        super(StdStreamCapturingMixin, self).setUp()
+    def run(self, result=None):
+        if result is None or not hasattr(os, "fork"):
+            return super(ForkIsolationMixin, self).run(result)
+        self._finish_forked(self._start_forked(), result)
+        return result
+
+    def _start_forked(self):
+        """Fork a child to run this test.  Returns (pid, read_fd)."""
+        import pickle
+        sys.stdout.flush()
+        sys.stderr.flush()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                recorder = _RecordingResult()
+                _reset_exit_records()
+                super(ForkIsolationMixin, self).run(recorder)
+                data = pickle.dumps(
+                    {"events": recorder.events, "records": _exit_records(type(self))}, 2,
+                )
+                while data:
+                    data = data[os.write(write_fd, data):]
+                status = 0
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os._exit(status)
+        os.close(write_fd)
+        return pid, read_fd
+
+    def _finish_forked(self, child, result, data=None):
+        """Wait for `child` to finish, and report its results to `result`.
+
+        `data` is what has already been read from the child, if anything.
 
-        # Capture stdout and stderr so we can examine them in tests.
-        # nose keeps stdout from littering the screen, so we can safely _Tee
-        # it, but it doesn't capture stderr, so we don't want to _Tee stderr to
-        # the real stderr, since it will interfere with our nice field of dots.
-        old_stdout = sys.stdout
-        self.captured_stdout = six.StringIO()
-        sys.stdout = _Tee(sys.stdout, self.captured_stdout)
-
-        old_stderr = sys.stderr
-        self.captured_stderr = six.StringIO()
-        if self.show_stderr:
-            sys.stderr = _Tee(sys.stderr, self.captured_stderr)
+        """
+        import pickle
+        pid, read_fd = child
+        chunks = [data or b""]
+        while True:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+
+        data = b"".join(chunks)
+        if data:
+            data = pickle.loads(data)
+            _replay_events(self, data["events"], result)
+            _merge_exit_records(type(self), data["records"])
         else:
-            sys.stderr = self.captured_stderr
+            result.startTest(self)
+            result.addError(self, _exc_info(ForkedTestError(
+                "Forked test process ended badly, with status {0}".format(status)
+            )))
+            result.stopTest(self)
+
+
+def _flatten_tests(tests):
+    """Produce the individual tests in a suite, however deeply nested."""
+    for test in tests:
+        if isinstance(test, unittest.TestSuite):
+            for t in _flatten_tests(test):
+                yield t
+        else:
+            yield test
 
-        self.addCleanup(self._cleanup_std_streams, old_stdout, old_stderr)
 
-    def _cleanup_std_streams(self, old_stdout, old_stderr):
-        """Restore stdout and stderr."""
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
+class _FixtureError(object):
+    """Stands in for a test when reporting a failed class or module fixture.
 
-    def stdout(self):
-        """Return the data written to stdout during the test."""
-        return self.captured_stdout.getvalue()
+    This is what unittest's own suites report: the "test" is described as,
+    for example, "setUpClass (tests.test_foo.FooTest)".
 
-    def stderr(self):
-        """Return the data written to stderr during the test."""
-        return self.captured_stderr.getvalue()
+    """
 
+    failureException = None
 
-class DelayedAssertionMixin(unittest.TestCase):
-    """A test case mixin that provides a `delayed_assertions` context manager.
+    def __init__(self, description):
+        self.description = description
 
-    Use it like this::
+    def id(self):
+        return self.description
 
-        with self.delayed_assertions():
-            self.assertEqual(x, y)
-            self.assertEqual(z, w)
+    def shortDescription(self):
+        return None
 
-    All of the assertions will run.  The failures will be displayed at the end
-    of the with-statement.
+    def __str__(self):
+        return self.description
+
+    def countTestCases(self):
+        return 0
 
-    NOTE: this only works with some assertions.  These are known to work:
 
-        - `assertEqual(str, str)`
+def _run_fixture(result, fixture, description):
+    """Call `fixture`, reporting any exception to `result` as `description`.
 
-        - `assertMultilineEqual(str, str)`
+    Returns True if the fixture succeeded.
 
     """
-    def __init__(self, *args, **kwargs):
-        super(DelayedAssertionMixin, self).__init__(*args, **kwargs)
-        # This mixin only works with assert methods that call `self.fail`.  In
-        # Python 2.7, `assertEqual` didn't, but we can do what Python 3 does,
-        # and use `assertMultiLineEqual` for comparing strings.
-        self.addTypeEqualityFunc(str, 'assertMultiLineEqual')
-        self._delayed_assertions = None
+    try:
+        fixture()
+    except unittest.SkipTest as exc:
+        result.addSkip(_FixtureError(description), str(exc))
+        return False
+    except Exception:
+        result.addError(_FixtureError(description), sys.exc_info())
+        return False
+    return True
+
+
+def _run_class_cleanups(klass, result):
+    """Run the class cleanups of `klass`, where there are such things."""
+    if hasattr(klass, "doClassCleanups"):
+        klass.doClassCleanups()
+        for err in klass.tearDown_exceptions:
+            result.addError(
+                _FixtureError("tearDownClass ({0}.{1})".format(klass.__module__, klass.__name__)),
+                err,
+            )
+
+
+def _tear_down_module(module_name, module_ok, result):
+    """Run tearDownModule for the module `module_name`, if it was set up."""
+    if module_name is not None and module_ok:
+        module = sys.modules.get(module_name)
+        _run_fixture(
+            result,
+            getattr(module, "tearDownModule", lambda: None),
+            "tearDownModule ({0})".format(module_name),
+        )
 
-    @contextlib.contextmanager
-    def delayed_assertions(self):
-        """The context manager: assert that we didn't collect any assertions."""
-        self._delayed_assertions = []
-        old_fail = self.fail
-        self.fail = self._delayed_fail
-        try:
-            yield
-        finally:
-            self.fail = old_fail
-        if self._delayed_assertions:
-            if len(self._delayed_assertions) == 1:
-                self.fail(self._delayed_assertions[0])
-            else:
-                self.fail(
-                    "{0} failed assertions:\n{1}".format(
-                        len(self._delayed_assertions),
-                        "\n".join(self._delayed_assertions),
-                    )
-                )
 
-    def _delayed_fail(self, msg=None):
-        """The stand-in for TestCase.fail during delayed_assertions."""
-        self._delayed_assertions.append(msg)
+def run_forked_tests(tests, result, processes=4):
+    """Run tests, with up to `processes` forked children running at once.
+
+    `tests` is a suite or iterable of tests.  Tests using ForkIsolationMixin
+    are run in parallel, each in its own forked child.  Other tests are run
+    normally.  Module and class setup and teardown are run once in this
+    process around each module's and class's tests, so children are forked
+    from a warm parent.  Skipped classes are skipped, and no more tests are
+    started once `result.shouldStop` is set.
+
+    """
+    import select
+    # The tests by class, and the classes in the order they came.
+    by_class = {}
+    classes = []
+    for test in _flatten_tests(tests):
+        if test.__class__ not in by_class:
+            by_class[test.__class__] = []
+            classes.append(test.__class__)
+        by_class[test.__class__].append(test)
+
+    module_name = None
+    module_ok = False
+    for klass in classes:
+        class_tests = by_class[klass]
+        if result.shouldStop:
+            break
+
+        if klass.__module__ != module_name:
+            _tear_down_module(module_name, module_ok, result)
+            module_name = klass.__module__
+            module = sys.modules.get(module_name)
+            module_ok = _run_fixture(
+                result,
+                getattr(module, "setUpModule", lambda: None),
+                "setUpModule ({0})".format(module_name),
+            )
+        if not module_ok:
+            continue
+
+        if getattr(klass, "__unittest_skip__", False):
+            # The tests report themselves as skipped.
+            for test in class_tests:
+                test(result)
+            continue
+
+        class_name = "{0}.{1}".format(klass.__module__, klass.__name__)
+        if not _run_fixture(result, klass.setUpClass, "setUpClass ({0})".format(class_name)):
+            _run_class_cleanups(klass, result)
+            continue
+
+        if not (issubclass(klass, ForkIsolationMixin) and hasattr(os, "fork")):
+            for test in class_tests:
+                if result.shouldStop:
+                    break
+                test(result)
+        else:
+            pending = list(class_tests)
+            running = {}        # read_fd -> (test, child, chunks)
+            while running or (pending and not result.shouldStop):
+                while pending and len(running) < processes and not result.shouldStop:
+                    test = pending.pop(0)
+                    child = test._start_forked()
+                    running[child[1]] = (test, child, [])
+                readable, _, _ = select.select(list(running), [], [])
+                for read_fd in readable:
+                    test, child, chunks = running[read_fd]
+                    chunk = os.read(read_fd, 65536)
+                    if chunk:
+                        chunks.append(chunk)
+                    else:
+                        del running[read_fd]
+                        # The pipe is at EOF, so this just waits and reports.
+                        test._finish_forked(child, result, b"".join(chunks))
+
+        _run_fixture(result, klass.tearDownClass, "tearDownClass ({0})".format(class_name))
+        _run_class_cleanups(klass, result)
+
+    _tear_down_module(module_name, module_ok, result)
 
 
 def make_file(filename, text="", bytes=b"", newline=None):
@@ -307,13 +2404,7 @@ def make_file(filename, text="", bytes=b"", newline=None):
     if bytes:
         data = bytes
     else:
-        text = textwrap.dedent(text)
-        if newline:
-            text = text.replace("\n", newline)
-        if six.PY3:
-            data = text.encode('utf8')
-        else:
-            data = text
+        data = _text_to_bytes(text, newline)
 
     # Make sure the directories are available.
     dirs, _ = os.path.split(filename)
@@ -327,6 +2418,708 @@ def make_file(filename, text="", bytes=b"", newline=None):
     return filename
 
 
+def _text_to_bytes(text, newline=None):
+    """Dedent `text`, apply `newline`, and encode it, as `make_file` does."""
+    text = textwrap.dedent(text)
+    if newline:
+        text = text.replace("\n", newline)
+    if PY3:
+        return text.encode('utf8')
+    else:
+        return text
+
+
+# Archives extracted by `make_tree`, keyed by the hash of their content, and
+# the directory they are extracted into, kept until the process ends.
+_extracted_trees = {}
+_tree_cache_dir = []
+
+# Content hashes of archives, keyed by (path, size, mtime), so that an
+# archive is only read once.
+_archive_hashes = {}
+
+
+def make_tree(source, dest=".", hardlink=False):
+    """Fill a directory with files from a fixture tree.
+
+    `source` is a tar file (compressed or not), a zip file, or a directory.
+    Its files are copied into `dest`, which is created if need be.
+
+    Archives are extracted once per process into a cache, keyed by their
+    content, and the cached tree is copied from then on.  If `hardlink` is
+    True, files are hard-linked from the cache or directory instead of
+    copied, which is faster, but only safe if the files won't be changed in
+    place.
+
+    Returns a list of the files made, relative to `dest`.
+
+    """
+    if os.path.isdir(source):
+        tree = source
+    else:
+        tree = _extracted_tree(source)
+    return _copy_tree(tree, dest, hardlink)
+
+
+def _extracted_tree(archive):
+    """The directory holding the extracted contents of `archive`."""
+    key = _archive_hash(archive)
+    if key not in _extracted_trees:
+        import tempfile
+        if not _tree_cache_dir:
+            _tree_cache_dir.append(tempfile.mkdtemp(prefix="unittest_mixins_trees_"))
+            _register_at_exit(_delete_extracted_trees)
+        tree = os.path.join(_tree_cache_dir[0], key)
+        _extract_archive(archive, tree)
+        _extracted_trees[key] = tree
+    return _extracted_trees[key]
+
+
+def _delete_extracted_trees():
+    """Called at process exit to delete the cache of extracted archives."""
+    import shutil
+    if _tree_cache_dir:
+        shutil.rmtree(_tree_cache_dir.pop(), ignore_errors=True)
+    _extracted_trees.clear()
+
+
+def _archive_hash(archive):
+    """The hex SHA-256 of the content of the file `archive`."""
+    import hashlib
+    stat = os.stat(archive)
+    file_key = (os.path.abspath(archive), stat.st_size, stat.st_mtime)
+    if file_key not in _archive_hashes:
+        sha = hashlib.sha256()
+        for chunk in _file_chunks(archive):
+            sha.update(chunk)
+        _archive_hashes[file_key] = sha.hexdigest()
+    return _archive_hashes[file_key]
+
+
+def _is_inside(path, directory):
+    """Is `path` in the tree rooted at `directory`?"""
+    path = os.path.normpath(os.path.join(directory, path))
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def _extract_archive(archive, dest):
+    """Extract the tar or zip file `archive` into the directory `dest`.
+
+    Members that would be written outside of `dest`, links that point outside
+    of it, and device files raise ValueError.
+
+    """
+    import tarfile
+    import zipfile
+
+    dest = os.path.abspath(dest)
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for name in zf.namelist():
+                if os.path.isabs(name) or not _is_inside(name, dest):
+                    raise ValueError("Unsafe path in {0!r}: {1!r}".format(archive, name))
+            zf.extractall(dest)
+    elif tarfile.is_tarfile(archive):
+        with tarfile.open(archive, "r:*") as tf:
+            members = tf.getmembers()
+            for member in members:
+                name = member.name
+                if os.path.isabs(name) or not _is_inside(name, dest):
+                    raise ValueError("Unsafe path in {0!r}: {1!r}".format(archive, name))
+                if member.issym():
+                    target = os.path.join(os.path.dirname(name), member.linkname)
+                elif member.islnk():
+                    target = member.linkname
+                elif member.isfile() or member.isdir():
+                    continue
+                else:
+                    raise ValueError("Unsafe member in {0!r}: {1!r}".format(archive, name))
+                if os.path.isabs(member.linkname) or not _is_inside(target, dest):
+                    raise ValueError("Unsafe link in {0!r}: {1!r}".format(archive, name))
+            if not os.path.exists(dest):
+                os.makedirs(dest)
+            if hasattr(tarfile, "data_filter"):
+                tf.extractall(dest, members, filter="data")
+            else:
+                tf.extractall(dest, members)
+    else:
+        raise ValueError("Not a tar or zip file: {0!r}".format(archive))
+
+
+def _copy_tree(source, dest, hardlink=False):
+    """Copy the files in the `source` tree into `dest`.
+
+    Files are hard-linked instead if `hardlink` is True and it's possible.
+    Symlinks are copied as symlinks.
+
+    Returns a list of the files made, relative to `dest`.
+
+    """
+    import shutil
+    made = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        rel_dir = os.path.relpath(dirpath, source)
+        dest_dir = os.path.normpath(os.path.join(dest, rel_dir))
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+        names = filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+        for name in names:
+            from_path = os.path.join(dirpath, name)
+            to_path = os.path.join(dest_dir, name)
+            if os.path.islink(from_path):
+                os.symlink(os.readlink(from_path), to_path)
+            else:
+                linked = False
+                if hardlink:
+                    try:
+                        os.link(from_path, to_path)
+                        linked = True
+                    except (AttributeError, OSError):
+                        # No hard links on this platform, or across devices.
+                        pass
+                if not linked:
+                    shutil.copy(from_path, to_path)
+            made.append(os.path.normpath(os.path.join(rel_dir, name)))
+    return made
+
+
+class _FixtureHasher(object):
+    """Hashes the files a fixture builder would make, without making them."""
+
+    def __init__(self, key):
+        import hashlib
+        self._sha = hashlib.sha256()
+        self._update("key", repr(key))
+
+    def _update(self, *parts):
+        """Add `parts`, strings or bytes, to the hash."""
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = part.encode("utf8")
+            self._sha.update(str(len(part)).encode("ascii") + b":" + part)
+
+    def make_file(self, filename, data):
+        """Record that `data` would be written to `filename`."""
+        self._update("make_file", filename, data)
+
+    def make_tree(self, source, dest):
+        """Record that the `source` tree would be copied into `dest`."""
+        if os.path.isdir(source):
+            fingerprint = _tree_fingerprint(source)
+        else:
+            fingerprint = _archive_hash(source)
+        self._update("make_tree", fingerprint, dest)
+
+    def hexdigest(self):
+        """The hash of everything recorded, as a hex string."""
+        return self._sha.hexdigest()
+
+
+def _tree_fingerprint(dirname):
+    """A string that changes when the files in the `dirname` tree change.
+
+    File names, sizes, and modification times are used, not contents.
+
+    """
+    parts = []
+    for dirpath, dirnames, filenames in os.walk(dirname):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            stat = os.lstat(path)
+            parts.append("{0}:{1}:{2!r}".format(
+                os.path.relpath(path, dirname), stat.st_size, stat.st_mtime,
+            ))
+    return "\n".join(parts)
+
+
+def _store_fixture_tree(filenames, entry):
+    """Store copies of `filenames` in the fixture cache directory `entry`.
+
+    The files are copied to a temporary directory next to `entry`, which is
+    then renamed, so that the cache never has a partial entry.  Other entries
+    for the same test are removed.
+
+    """
+    import random
+    import shutil
+    parent = os.path.dirname(entry)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    temp_entry = "{0}.tmp{1}_{2:08d}".format(entry, os.getpid(), random.randint(0, 99999999))
+    for filename in filenames:
+        to_path = os.path.join(temp_entry, filename)
+        to_dir = os.path.dirname(to_path)
+        if not os.path.isdir(to_dir):
+            os.makedirs(to_dir)
+        shutil.copy(filename, to_path)
+    if not os.path.isdir(temp_entry):
+        os.makedirs(temp_entry)
+    try:
+        os.rename(temp_entry, entry)
+    except OSError:
+        # Another process stored it first.
+        shutil.rmtree(temp_entry, ignore_errors=True)
+        return
+    for other in os.listdir(parent):
+        other = os.path.join(parent, other)
+        if other != entry and ".tmp" not in os.path.basename(other):
+            shutil.rmtree(other, ignore_errors=True)
+
+
+# How many bytes to read at a time when comparing file contents.
+COMPARE_CHUNK_SIZE = 64 * 1024
+
+# How many lines of context to show on each side of the first difference.
+COMPARE_CONTEXT_LINES = 3
+
+# The most bytes of context to show on each side of the first difference.
+COMPARE_CONTEXT_BYTES = 4096
+
+
+class _ChunkReader(object):
+    """Read pieces of any size from an iterable of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        # The bytes read from the chunks but not yet returned start at
+        # self._pending[self._start:].  Keeping an offset instead of slicing
+        # off the front of self._pending keeps a large chunk from being copied
+        # over and over.
+        self._pending = b""
+        self._start = 0
+
+    def read(self, size):
+        """Read `size` bytes, or fewer if the chunks run out."""
+        start = self._start
+        end = start + size
+        if end > len(self._pending):
+            pieces = [self._pending[start:]]
+            have = len(pieces[0])
+            while have < size:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf8')
+                pieces.append(chunk)
+                have += len(chunk)
+            self._pending = b"".join(pieces)
+            start, end = 0, size
+        self._start = min(end, len(self._pending))
+        return self._pending[start:end]
+
+    def close(self):
+        """Close the underlying iterator, if it can be closed."""
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _file_chunks(filename, chunk_size=COMPARE_CHUNK_SIZE):
+    """Produce the bytes in `filename`, `chunk_size` bytes at a time."""
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _last_lines(data):
+    """The end of `data`: its last partial line and a few lines before it."""
+    end = len(data)
+    for _ in range(COMPARE_CONTEXT_LINES + 1):
+        end = data.rfind(b"\n", 0, end)
+        if end < 0:
+            break
+    return data[end+1:][-COMPARE_CONTEXT_BYTES:]
+
+
+def _first_lines(data):
+    """The start of `data`: its first partial line and a few lines after it."""
+    start = 0
+    for _ in range(COMPARE_CONTEXT_LINES + 1):
+        start = data.find(b"\n", start) + 1
+        if start == 0:
+            start = len(data)
+            break
+    return data[:start][:COMPARE_CONTEXT_BYTES]
+
+
+def _first_difference(actual, expected, chunk_size=COMPARE_CHUNK_SIZE):
+    """Find where two iterables of byte chunks first differ.
+
+    Neither iterable is read any further than needed.  Returns None if they
+    are the same.  Otherwise returns a tuple: the line number and byte offset
+    of the first difference, the bytes just before it, and the bytes just
+    after it from `actual` and from `expected`.
+
+    """
+    actual = _ChunkReader(actual)
+    expected = _ChunkReader(expected)
+    try:
+        offset = 0
+        line = 1
+        before = b""
+        while True:
+            a = actual.read(chunk_size)
+            e = expected.read(chunk_size)
+            if a == e:
+                if not a:
+                    return None
+                offset += len(a)
+                line += a.count(b"\n")
+                before = _last_lines(before + a)
+                continue
+
+            same = _common_prefix_length(a, e)
+            same_data = a[:same]
+            return (
+                line + same_data.count(b"\n"),
+                offset + same,
+                _last_lines(before + same_data),
+                _first_lines(a[same:] + actual.read(COMPARE_CONTEXT_BYTES)),
+                _first_lines(e[same:] + expected.read(COMPARE_CONTEXT_BYTES)),
+            )
+    finally:
+        actual.close()
+        expected.close()
+
+
+def _context_lines(data):
+    """Split bytes into text lines for a diff, each ending with a newline."""
+    if PY3:
+        data = data.decode('utf8', 'replace')
+    lines = data.splitlines(True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    return lines
+
+
+def _dir_size(dirname):
+    """The total size in bytes of the files in the `dirname` tree."""
+    total = 0
+    for dirpath, _, filenames in os.walk(dirname):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _largest_files(dirname, count):
+    """The `count` largest files in the `dirname` tree.
+
+    Returns a list of (size, path) pairs, biggest first, with paths relative
+    to `dirname`.
+
+    """
+    import heapq
+    sizes = []
+    for dirpath, _, filenames in os.walk(dirname):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                sizes.append((os.lstat(path).st_size, os.path.relpath(path, dirname)))
+            except OSError:
+                pass
+    return heapq.nlargest(count, sizes)
+
+
+# How many of the largest files to list when a test goes over its temp
+# directory quota.
+TEMP_DIR_QUOTA_REPORT_FILES = 10
+
+
+# The program run by each warm Python worker.  It reads jobs as JSON lines on
+# stdin, and forks a child for each, so that every job starts from the same
+# clean, already-started interpreter.  Results are JSON lines on stdout.
+_PYTHON_WORKER_SOURCE = r"""
+import sys
+startup_modules = set(sys.modules)
+
+import base64, json, os, tempfile, traceback
+
+def native(value):
+    # JSON gives us unicode, but Python 2 scripts expect byte strings.
+    if sys.version_info >= (3,):
+        return value
+    if isinstance(value, list):
+        return [native(v) for v in value]
+    if isinstance(value, dict):
+        return dict((native(k), native(v)) for k, v in value.items())
+    return value.encode("utf-8")
+
+# Python 2 clears a module's globals when it's deleted, so keep this one
+# alive after the script's __main__ replaces it.
+worker_main = sys.modules["__main__"]
+
+def run_script(script):
+    main = type(sys)("__main__")
+    main.__file__ = script
+    main.__builtins__ = __builtins__
+    sys.modules["__main__"] = main
+    with open(script, "rb") as f:
+        code = compile(f.read(), script, "exec")
+    exec(code, main.__dict__)
+
+def run_exit_functions():
+    exitfunc = getattr(sys, "exitfunc", None)
+    if exitfunc is not None:
+        # Python 2
+        del sys.exitfunc
+        exitfunc()
+    elif sys.version_info >= (3,):
+        import atexit
+        atexit._run_exitfuncs()
+
+def run_job(job):
+    outputs = [tempfile.TemporaryFile(), tempfile.TemporaryFile()]
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(outputs[0].fileno(), 1)
+            os.dup2(outputs[1].fileno(), 2)
+            job = native(job)
+            os.chdir(job["cwd"])
+            os.environ.clear()
+            os.environ.update(job["env"])
+            sys.path[:] = job["path"]
+            sys.argv = [job["script"]] + job["args"]
+            # Forget the modules the worker imported for itself.
+            for name in set(sys.modules) - startup_modules:
+                del sys.modules[name]
+            try:
+                run_script(job["script"])
+                status = 0
+            except SystemExit as exc:
+                if exc.code is None:
+                    status = 0
+                elif isinstance(exc.code, int):
+                    status = exc.code
+                else:
+                    sys.stderr.write("%s\n" % (exc.code,))
+            except BaseException:
+                # Show the traceback from the script, not from here.
+                exc_type, exc_value, exc_tb = sys.exc_info()
+                while exc_tb and exc_tb.tb_frame.f_code.co_filename == "<string>":
+                    exc_tb = exc_tb.tb_next
+                traceback.print_exception(exc_type, exc_value, exc_tb)
+            try:
+                run_exit_functions()
+            except BaseException:
+                traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(status)
+
+    _, status = os.waitpid(pid, 0)
+    if os.WIFEXITED(status):
+        status = os.WEXITSTATUS(status)
+    else:
+        status = -os.WTERMSIG(status)
+    result = {"status": status}
+    for name, output in zip(["stdout", "stderr"], outputs):
+        output.seek(0)
+        result[name] = base64.b64encode(output.read()).decode("ascii")
+        output.close()
+    return result
+
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    sys.stdout.write(json.dumps(run_job(json.loads(line))) + "\n")
+    sys.stdout.flush()
+"""
+
+
+class _PythonWorker(object):
+    """A warm Python interpreter, ready to run scripts for us."""
+
+    # Start a new worker after this many jobs, just in case.
+    max_jobs = 500
+
+    def __init__(self):
+        import subprocess
+        self.jobs = 0
+        self._process = subprocess.Popen(
+            [sys.executable, "-c", _PYTHON_WORKER_SOURCE],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        # The worker lives across tests, so it isn't a leak.
+        self._long_lived_fds = [self._process.stdin.fileno(), self._process.stdout.fileno()]
+        _long_lived_fds.update(self._long_lived_fds)
+        _long_lived_pids.add(self._process.pid)
+
+    def run(self, job):
+        """Run `job`, a dict, and return the result dict, or None if we died."""
+        import json
+        self.jobs += 1
+        try:
+            self._process.stdin.write(json.dumps(job) + "\n")
+            self._process.stdin.flush()
+        except (IOError, OSError):
+            return None
+        line = self._process.stdout.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        """Stop the worker."""
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+        self._process.wait()
+        self._process.stdout.close()
+        _long_lived_fds.difference_update(self._long_lived_fds)
+        _long_lived_pids.discard(self._process.pid)
+
+
+class _PythonWorkerPool(object):
+    """A pool of warm Python interpreters.
+
+    `size` workers are kept started and idle, ready for the next jobs.
+
+    """
+
+    def __init__(self, size=1):
+        import threading
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = []
+        self._fill()
+
+    def _fill(self):
+        """Start workers until we have `size` of them idle."""
+        with self._lock:
+            while len(self._idle) < self.size:
+                self._idle.append(_PythonWorker())
+
+    def run(self, job):
+        """Run `job` in one of our workers, and return the result dict."""
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is None:
+            worker = _PythonWorker()
+        result = worker.run(job)
+        if result is None:
+            # The worker died somehow.  Try once more with a fresh one.
+            worker.close()
+            worker = _PythonWorker()
+            result = worker.run(job)
+            if result is None:
+                worker.close()
+                raise RuntimeError("Couldn't run {0!r} in a Python worker".format(job["script"]))
+
+        if worker.jobs >= worker.max_jobs:
+            worker.close()
+        else:
+            with self._lock:
+                self._idle.append(worker)
+        self._fill()
+        return result
+
+    def close(self):
+        """Stop all of the idle workers."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+# The pool of warm Python workers, made when first needed, and the process
+# it belongs to.
+_python_workers = None
+_python_workers_pid = None
+
+
+def _get_python_workers():
+    """Get this process's pool of warm Python workers.
+
+    A forked child gets a pool of its own: using its parent's workers would
+    cross its results with those of the parent and its other children.
+
+    """
+    global _python_workers, _python_workers_pid
+    if _python_workers is None or _python_workers_pid != os.getpid():
+        _python_workers = _PythonWorkerPool()
+        _python_workers_pid = os.getpid()
+        _register_at_exit(_python_workers.close)
+    return _python_workers
+
+
+def _decode_output(data):
+    """Decode output bytes from a script into a native string."""
+    if PY3:
+        return data.decode("utf8", "replace")
+    return data
+
+
+def run_python(filename, args=()):
+    """Run a Python file as if by "python `filename` `args`".
+
+    The file is run with the current directory, environment, and sys.path
+    (after the directory containing `filename`).  Where os.fork is available,
+    the interpreter is forked from a warm worker, which is much faster than
+    starting a new one.  The forked interpreter has only the modules that
+    Python imports at startup, and runs the atexit functions when the script
+    ends, but it isn't completely fresh: those startup modules were imported
+    by the worker, with the environment it started with.
+
+    Returns a tuple: the exit status, and the stdout and stderr output.
+
+    """
+    import base64
+    import subprocess
+
+    if hasattr(os, "fork"):
+        result = _get_python_workers().run({
+            "script": filename,
+            "args": list(args),
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+            "path": (
+                [os.path.dirname(os.path.abspath(filename))] +
+                [p or os.getcwd() for p in sys.path]
+            ),
+        })
+        stdout = base64.b64decode(result["stdout"])
+        stderr = base64.b64decode(result["stderr"])
+        status = result["status"]
+    else:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p or os.getcwd() for p in sys.path)
+        proc = subprocess.Popen(
+            [sys.executable, filename] + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+        )
+        stdout, stderr = proc.communicate()
+        status = proc.returncode
+    return status, _decode_output(stdout), _decode_output(stderr)
+
+
+# A class's temp directories are too slow if making and deleting them takes
+# more than this many times as long as its tests, and at least this long.
+TEMP_DIR_OVERHEAD_FACTOR = 5
+TEMP_DIR_OVERHEAD_MIN_TIME = 0.1
+
+
 class TempDirMixin(SysPathAwareMixin, ModuleAwareMixin, unittest.TestCase):
     """A test case mixin that creates a temp directory and files in it.
 
@@ -354,51 +3147,123 @@ class TempDirMixin(SysPathAwareMixin, ModuleAwareMixin, unittest.TestCase):
     # Use this prefix when making temp directories.
     temp_dir_prefix = "test_"
 
+    # The directory for the persistent cache used by `cached_fixtures`.  If
+    # None, the UNITTEST_MIXINS_FIXTURE_CACHE environment variable is used.
+    fixture_cache_dir = None
+
+    # While `cached_fixtures` runs a builder: the hasher for a dry run, or the
+    # list of files made in a real run.
+    _fixture_hasher = None
+    _fixture_files = None
+
+    # The most bytes a test may have in its temp directory, or None for no
+    # limit.  If None, the UNITTEST_MIXINS_TEMP_DIR_QUOTA environment variable
+    # is used, if set.
+    temp_dir_quota = None
+
+    # Set this to hard-link the files from fixture trees made with make_tree,
+    # rather than copy them.  Only do this if the tests don't change the
+    # files in place.  Files from the cached_fixtures cache are always copied.
+    make_tree_hardlinks = False
+
     def setUp(self):
+        # Find the fixture cache before other mixins or we change directories.
+        cache_dir = self.fixture_cache_dir or os.environ.get("UNITTEST_MIXINS_FIXTURE_CACHE")
+        self._fixture_cache = os.path.abspath(cache_dir) if cache_dir else None
+
         super(TempDirMixin, self).setUp()
 
-        if self.run_in_temp_dir:
-            # Create a temporary directory.
-            self.temp_dir = self._make_temp_dir()
-            self.chdir(self.temp_dir)
+        # When the process ends, find out about bad classes.
+        _register_at_exit(TempDirMixin._report_on_class_behavior)
 
-            # Modules should be importable from this temp directory.  We don't
-            # use '' because we make lots of different temp directories and
-            # nose's caching importer can get confused.  The full path prevents
-            # problems.
-            sys.path.insert(0, os.getcwd())
+        with _timing(self, "TempDirMixin", "setup"):
+            if self.run_in_temp_dir:
+                # Create a temporary directory.
+                self.temp_dir = self._make_temp_dir()
+                self.chdir(self.temp_dir)
 
-        class_behavior = self._class_behavior()
-        class_behavior.tests += 1
-        class_behavior.temp_dir = self.run_in_temp_dir
-        class_behavior.no_files_ok = self.no_files_in_temp_dir
+                # Modules should be importable from this temp directory.  We
+                # don't use '' because we make lots of different temp
+                # directories and nose's caching importer can get confused.
+                # The full path prevents problems.
+                sys.path.insert(0, os.getcwd())
 
-        self.addCleanup(self._check_behavior)
+            class_behavior = self._class_behavior()
+            class_behavior.tests += 1
+            class_behavior.temp_dir = self.run_in_temp_dir
+            class_behavior.no_files_ok = self.no_files_in_temp_dir
+            class_behavior.test_method_made_any_files = False
+
+            self._quota = self.temp_dir_quota
+            if self._quota is None and os.environ.get("UNITTEST_MIXINS_TEMP_DIR_QUOTA"):
+                self._quota = int(os.environ["UNITTEST_MIXINS_TEMP_DIR_QUOTA"])
+            # Bytes written with make_file and make_tree, for the quota and the
+            # peak size when the temp dir isn't scanned.
+            self._bytes_in_temp_dir = 0
+
+            _add_timed_cleanup(self, "TempDirMixin", self._check_behavior)
+
+        self._test_start = _clock()
 
     def _check_behavior(self):
         """Check that we did the right things."""
 
         class_behavior = self._class_behavior()
+        class_behavior.test_time += _clock() - self._test_start
         if class_behavior.test_method_made_any_files:
             class_behavior.tests_making_files += 1
+        if self.run_in_temp_dir:
+            if self._quota is not None or os.environ.get("UNITTEST_MIXINS_CLASS_BEHAVIOR"):
+                # Walking the tree also finds files not made with make_file.
+                size = _dir_size(self.temp_dir)
+            else:
+                size = self._bytes_in_temp_dir
+            class_behavior.peak_temp_dir_size = max(class_behavior.peak_temp_dir_size, size)
+            if self._quota is not None and size > self._quota:
+                self._fail_over_quota(size, "The test")
+
+    def _fail_over_quota(self, size, what, pending=None):
+        """Fail the test for using `size` bytes, more than its quota.
+
+        `what` is what used the space.  `pending` is a (size, filename) pair
+        for a file about to be written, or None.
+
+        """
+        largest = _largest_files(self.temp_dir, TEMP_DIR_QUOTA_REPORT_FILES)
+        if pending is not None:
+            largest = sorted(largest + [pending], reverse=True)[:TEMP_DIR_QUOTA_REPORT_FILES]
+        self.fail(
+            "{0} used {1} bytes in its temp directory, over the quota of {2}.  "
+            "Largest files:\n{3}".format(
+                what, size, self._quota,
+                "".join("    {0:>12}  {1}\n".format(*f) for f in largest),
+            )
+        )
 
     def _make_temp_dir(self):
         """Make a temp directory that is cleaned up when the test is done."""
-        slug = re.sub(r"[^\w]+", "_", self.id())
+        import random
+        import tempfile
+        slug = _test_slug(self.id())
         name = "{0}{1}_{2:08d}".format(
             self.temp_dir_prefix,
             slug,
             random.randint(0, 99999999)
         )
         temp_dir = os.path.join(tempfile.gettempdir(), name)
+        start = _clock()
         os.makedirs(temp_dir)
-        self.addCleanup(self._delete_temp_dir, temp_dir)
+        self._class_behavior().temp_dir_time += _clock() - start
+        _add_timed_cleanup(self, "TempDirMixin", self._delete_temp_dir, temp_dir)
         return temp_dir
 
     def _delete_temp_dir(self, temp_dir):
         """Delete the temp directory, if we should."""
+        import shutil
         if not self.keep_temp_dir:
+            start = _clock()
             shutil.rmtree(temp_dir)
+            self._class_behavior().temp_dir_time += _clock() - start
 
     def skipTest(self, reason):
         """Skip this test, and give a reason."""
@@ -409,16 +3274,177 @@ class TempDirMixin(SysPathAwareMixin, ModuleAwareMixin, unittest.TestCase):
         """Change directory, and change back when the test is done."""
         old_dir = os.getcwd()
         os.chdir(new_dir)
-        self.addCleanup(os.chdir, old_dir)
+        _add_timed_cleanup(self, "TempDirMixin", os.chdir, old_dir)
 
     def make_file(self, filename, text="", bytes=b"", newline=None):
         """Create a file for testing.  See `make_file` for docs."""
 
         # Tests that call `make_file` should be run in a temp environment.
         assert self.run_in_temp_dir, "Should only use make_file in temp directories"
-        self._class_behavior().test_method_made_any_files = True
+        class_behavior = self._class_behavior()
+        class_behavior.test_method_made_any_files = True
+
+        data = bytes or _text_to_bytes(text, newline)
+        if self._fixture_hasher is not None:
+            self._fixture_hasher.make_file(filename, data)
+            return filename
+        if self._fixture_files is not None:
+            self._fixture_files.append(filename)
+
+        # Count the new bytes before writing them, so a test that would fill
+        # the disk fails before it does.
+        size = self._bytes_in_temp_dir + len(data)
+        if os.path.exists(filename):
+            size -= os.path.getsize(filename)
+        if self._quota is not None and size > self._quota:
+            self._fail_over_quota(
+                size, "make_file({0!r})".format(filename), (len(data), filename),
+            )
+        self._bytes_in_temp_dir = size
+
+        make_file(filename, bytes=data)
+        class_behavior.files_made += 1
+        class_behavior.bytes_written += len(data)
+        return filename
+
+    def make_tree(self, source, dest=".", hardlink=None):
+        """Fill a directory with files from a fixture tree.  See `make_tree` for docs.
+
+        If `hardlink` isn't given, the class's `make_tree_hardlinks` is used.
+
+        """
+        assert self.run_in_temp_dir, "Should only use make_tree in temp directories"
+        if self._fixture_hasher is not None:
+            self._fixture_hasher.make_tree(source, dest)
+            return []
+
+        if hardlink is None:
+            hardlink = self.make_tree_hardlinks
+        made = make_tree(source, dest, hardlink)
+        if self._fixture_files is not None:
+            self._fixture_files.extend(os.path.join(dest, filename) for filename in made)
+        self._count_files_made(made, dest, "make_tree({0!r})".format(source))
+        return made
+
+    def _count_files_made(self, made, dest, what):
+        """Account for the files `made` in `dest`, in the class behavior and quota."""
+        class_behavior = self._class_behavior()
+        class_behavior.test_method_made_any_files = True
+        class_behavior.files_made += len(made)
+        size = sum(os.lstat(os.path.join(dest, filename)).st_size for filename in made)
+        class_behavior.bytes_written += size
+        self._bytes_in_temp_dir += size
+        if self._quota is not None and self._bytes_in_temp_dir > self._quota:
+            self._fail_over_quota(self._bytes_in_temp_dir, what)
+
+    def cached_fixtures(self, builder, key=None):
+        """Make fixture files with `builder`, or copy them from a cache.
+
+        `builder` is a function of no arguments that makes files with
+        `make_file` and `make_tree`, and does nothing else that matters.  If
+        there is no fixture cache directory, `builder` is simply called.
+
+        Otherwise, `builder` is called once without making any files, to hash
+        what it would make, along with `key`, any value with a stable repr
+        that also affects the files.  If the cache has the files made by this
+        test with the same hash, they're copied from there.  If not,
+        `builder` is called again to make them, and they are stored in the
+        cache for next time.
+
+        The cache directory is `fixture_cache_dir`, or the directory named by
+        the UNITTEST_MIXINS_FIXTURE_CACHE environment variable, relative to
+        the current directory before the test started.  It persists between
+        runs, so that re-running tests is quicker.
+
+        Returns True if the files came from the cache.
+
+        """
+        if not self._fixture_cache:
+            builder()
+            return False
+
+        self._fixture_hasher = _FixtureHasher(key)
+        try:
+            builder()
+            digest = self._fixture_hasher.hexdigest()
+        finally:
+            self._fixture_hasher = None
+
+        entry = os.path.join(self._fixture_cache, _test_slug(self.id()), digest)
+        if os.path.isdir(entry):
+            # Always copy, even with make_tree_hardlinks: the cache lasts
+            # between runs, and a test changing a linked file would quietly
+            # change the cache for every later run.
+            made = _copy_tree(entry, ".")
+            self._count_files_made(made, ".", "cached_fixtures()")
+            return True
+
+        self._fixture_files = []
+        try:
+            builder()
+            filenames = self._fixture_files
+        finally:
+            self._fixture_files = None
+
+        cwd = os.getcwd()
+        relative = []
+        for filename in filenames:
+            filename = os.path.relpath(os.path.abspath(filename), cwd)
+            if not filename.startswith(os.pardir) and filename not in relative:
+                relative.append(filename)
+        _store_fixture_tree(relative, entry)
+        return False
+
+    def run_python(self, filename, args=()):
+        """Run a Python file as if by "python `filename`".  See `run_python` for docs.
+
+        The file is run in this test's current directory, with its
+        environment and sys.path.
+
+        """
+        return run_python(filename, args)
+
+    def assert_file_content(
+        self, filename, text=None, bytes=None, other_file=None, chunks=None, newline=None,
+    ):
+        """Assert that the file `filename` has the expected content.
+
+        Give exactly one of the expected contents: `text` (dedented and
+        encoded as `make_file` would, with `newline` if provided), `bytes`,
+        the name of another file `other_file`, or `chunks`, an iterable of
+        bytes or strings.
 
-        return make_file(filename, text, bytes, newline)
+        Both sides are read a piece at a time, so large files are never read
+        into memory.  The failure message reports the line and byte offset of
+        the first difference, with a few lines of context around it.
+
+        """
+        given = [x for x in [text, bytes, other_file, chunks] if x is not None]
+        if len(given) != 1:
+            raise ValueError(
+                "Need exactly one of text, bytes, other_file, or chunks"
+            )
+        if text is not None:
+            expected = [_text_to_bytes(text, newline)]
+        elif bytes is not None:
+            expected = [bytes]
+        elif other_file is not None:
+            expected = _file_chunks(other_file)
+        else:
+            expected = chunks
+
+        diff = _first_difference(_file_chunks(filename), expected)
+        if diff is not None:
+            line, offset, before, actual_after, expected_after = diff
+            difference = difflib.ndiff(
+                _context_lines(before + expected_after),
+                _context_lines(before + actual_after),
+            )
+            self.fail(
+                "{0!r} differs from expected at line {1}, byte offset {2}:\n{3}".format(
+                    filename, line, offset, "".join(difference),
+                )
+            )
 
     # We run some tests in temporary directories, because they may need to make
     # files for the tests. But this is expensive, so we can change per-class
@@ -437,6 +3463,17 @@ class TempDirMixin(SysPathAwareMixin, ModuleAwareMixin, unittest.TestCase):
             self.no_files_ok = False
             self.tests_making_files = 0
             self.test_method_made_any_files = False
+            # Files and bytes written with make_file.
+            self.files_made = 0
+            self.bytes_written = 0
+            # The most bytes any one test had in its temp directory.  The
+            # directory is only scanned if there's a quota or a JSON report,
+            # otherwise this counts only files from make_file and make_tree.
+            self.peak_temp_dir_size = 0
+            # Seconds spent making and deleting temp directories, and seconds
+            # spent in the tests themselves.
+            self.temp_dir_time = 0.0
+            self.test_time = 0.0
 
         def badness(self):
             """Return a string describing bad behavior, or None."""
@@ -446,6 +3483,15 @@ class TempDirMixin(SysPathAwareMixin, ModuleAwareMixin, unittest.TestCase):
             elif self.temp_dir and self.tests_making_files == 0:
                 if not self.no_files_ok:
                     bad = "Inefficient"
+            elif self.temp_dir and self.temp_dir_overhead_is_high():
+                return (
+                    "Slow temp dirs: %s spent %.3fs on temp directories, %.3fs in %d tests" % (
+                        self.klass.__name__,
+                        self.temp_dir_time,
+                        self.test_time,
+                        self.tests,
+                    )
+                )
 
             if bad:
                 where = "in a temp directory"
@@ -459,23 +3505,67 @@ class TempDirMixin(SysPathAwareMixin, ModuleAwareMixin, unittest.TestCase):
                     )
                 )
 
+        def merge(self, values):
+            """Add in another behavior's `values`, a dict of its attributes."""
+            for name in [
+                "tests", "skipped", "tests_making_files", "files_made", "bytes_written",
+                "temp_dir_time", "test_time",
+            ]:
+                setattr(self, name, getattr(self, name) + values[name])
+            self.peak_temp_dir_size = max(self.peak_temp_dir_size, values["peak_temp_dir_size"])
+            self.temp_dir = values["temp_dir"]
+            self.no_files_ok = values["no_files_ok"]
+
+        def temp_dir_overhead_is_high(self):
+            """Did making temp directories take much longer than the tests?"""
+            return (
+                self.temp_dir_time >= TEMP_DIR_OVERHEAD_MIN_TIME and
+                self.temp_dir_time > TEMP_DIR_OVERHEAD_FACTOR * self.test_time
+            )
+
+        def as_dict(self):
+            """The behavior as a dict, for machine-readable reports."""
+            return {
+                "class": "{0}.{1}".format(self.klass.__module__, self.klass.__name__),
+                "tests": self.tests,
+                "skipped": self.skipped,
+                "temp_dir": self.temp_dir,
+                "tests_making_files": self.tests_making_files,
+                "files_made": self.files_made,
+                "bytes_written": self.bytes_written,
+                "peak_temp_dir_size": self.peak_temp_dir_size,
+                "temp_dir_time": self.temp_dir_time,
+                "test_time": self.test_time,
+                "badness": self.badness(),
+            }
+
     # Map from class to info about how it ran.
     _class_behaviors = collections.defaultdict(_ClassBehavior)
 
     @classmethod
     def _report_on_class_behavior(cls):
-        """Called at process exit to report on class behavior."""
+        """Called at process exit to report on class behavior.
+
+        Bad behavior is printed.  Set the environment variable
+        UNITTEST_MIXINS_CLASS_BEHAVIOR to a file name to also get a JSON
+        report of every class's behavior.
+
+        """
         for behavior in cls._class_behaviors.values():
             badness = behavior.badness()
             if badness:
                 print(badness)
 
+        destination = os.environ.get("UNITTEST_MIXINS_CLASS_BEHAVIOR")
+        if destination:
+            import json
+            behaviors = [b.as_dict() for b in cls._class_behaviors.values()]
+            behaviors.sort(key=lambda b: b["class"])
+            with open(destination, "w") as f:
+                json.dump(behaviors, f, indent=4)
+
     def _class_behavior(self):
         """Get the ClassBehavior instance for this test."""
         behavior = self._class_behaviors[self.__class__]
         behavior.klass = self.__class__
         return behavior
-
-
-# When the process ends, find out about bad classes.
-atexit.register(TempDirMixin._report_on_class_behavior)